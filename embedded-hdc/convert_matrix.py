@@ -1,51 +1,99 @@
 """
-Convert .npy file into binary file readable by C
+Convert a trained model into files readable by C: the .hdcm container, a C header with
+bit-packed arrays, or a raw packed blob for .incbin.
 """
+import os
+import argparse
+import sys
 import numpy as np
 
-def npy2binary(model, codebook):
-    # Headers
-    header = {'10x10000' : [10,  0,  0,  0, 16, 39,  0,  0],
-            '56x10000': [56,  0,  0,  0, 16, 39,  0,  0],
-            }
-
-    codebook = codebook.flatten()
-    codebook = np.append(header['56x10000'], codebook).astype(np.uint8)
-    codebook.tofile('model/codebook_56_10000.data')
-
-    model = model.flatten()
-    model = np.append(header['10x10000'], model).astype(np.uint8)
-    model.tofile('model/model_10_10000.data')
-
-def npy2header(model, codebook):
-    res = "uint8_t model[10][10000] = {"
-    for x in model:
-        res += "{"
-        for y in x:
-            res += str(y)
-            res += ","
-        res = res[:-1] # remove the last comma
-        res += "},"
-    res = res[:-1]
-    res += "};\n"
-
-    res += "uint8_t codebook[56][10000] = {"
-    for x in codebook:
-        res += "{"
-        for y in x:
-            res += str(y)
-            res += ","
-        res = res[:-1] # remove the last comma
-        res += "},"
-    res = res[:-1]
-    res += "};"
-
-    with open('model/model.h', 'w') as f:
-        f.write(res)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mnist'))
+from hdc.model import save_model, load_model, pack_rows, unpack_rows, seeded_codebook
 
-if __name__ == "__main__":
-    codebook = np.load('model/codebook_56_10000.npy')
-    model = np.load('model/model_10_10000.npy')
+def load_legacy(path):
+    # old .data tables: int32 rows, int32 columns, then one byte per bit
+    raw = np.fromfile(path, dtype=np.uint8)
+    rows, columns = raw[:8].view('<i4')
+    return raw[8:].reshape(rows, columns)
+
+def npy2model(model, codebook, path='model/mnist_10_10000.hdcm', word_bits=64):
+    # write the bit-packed model container read by main.c and hdc-board.py
+    save_model(path, model, codebook, word_bits)
+
+C_TYPES = {8: 'uint8_t', 16: 'uint16_t', 32: 'uint32_t', 64: 'uint64_t'}
+
+def packed_words(bits, word_bits):
+    # rows of 0/1 -> rows of little-endian words, bit k in bit k % word_bits of word k // word_bits
+    return pack_rows(bits, word_bits).view('<u%d' % (word_bits // 8))
+
+def write_array(f, name, bits, word_bits):
+    # streams one row per line instead of building the initializer in memory
+    words = packed_words(bits, word_bits)
+    digits = word_bits // 4
+    f.write("const %s %s[%d][%d] = {\n" % (C_TYPES[word_bits], name, words.shape[0], words.shape[1]))
+    for i, row in enumerate(words):
+        f.write("    {")
+        f.write(",".join("0x%0*x" % (digits, w) for w in row.tolist()))
+        f.write("},\n" if i + 1 < len(words) else "}\n")
+    f.write("};\n")
+
+def npy2header(model, codebook, path='model/model.h', word_bits=32):
+    dims = model.shape[1]
+    with open(path, 'w') as f:
+        f.write("// generated by convert_matrix.py, do not edit\n")
+        f.write("#include <stdint.h>\n\n")
+        f.write("#define HDC_N_DIM %d\n" % dims)
+        f.write("#define HDC_N_CLASS %d\n" % len(model))
+        f.write("#define HDC_N_CODEBOOK %d\n" % len(codebook))
+        f.write("#define HDC_WORD_BITS %d\n" % word_bits)
+        f.write("#define HDC_N_WORDS %d\n\n" % (-(-dims // word_bits)))
+        write_array(f, "model", model, word_bits)
+        f.write("\n")
+        write_array(f, "codebook", codebook, word_bits)
 
-    npy2header(model, codebook)
-    
\ No newline at end of file
+def npy2blob(model, codebook, path='model/model.bin', word_bits=32):
+    # raw packed codebook rows followed by model rows, ready for .incbin
+    with open(path, 'wb') as f:
+        f.write(packed_words(codebook, word_bits).tobytes())
+        f.write(packed_words(model, word_bits).tobytes())
+
+def load_tables(path):
+    # (model, codebook) bits from a .hdcm container or a pair of legacy .data / .npy files
+    if path.endswith('.hdcm'):
+        header, model, codebook = load_model(path)
+        # a seed-only model gets its codebook regenerated, the C side needs the rows
+        codebook = seeded_codebook(header) if codebook is None else unpack_rows(codebook, header['dims'])
+        return unpack_rows(model, header['dims']), codebook
+    model_path, codebook_path = path.split(',')
+    load = np.load if model_path.endswith('.npy') else load_legacy
+    return load(model_path), load(codebook_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('input', nargs='?', default='model/mnist_10_10000.hdcm',
+                        help=".hdcm model, or 'model,codebook' as .npy or legacy .data files")
+    parser.add_argument('-o', '--output', help="output file (default model/model.h, .bin or .hdcm)")
+    parser.add_argument('-f', '--format', choices=['header', 'blob', 'hdcm'], default='header')
+    parser.add_argument('-w', '--word-bits', type=int, choices=sorted(C_TYPES), default=32)
+    parser.add_argument('--dims', type=int, help="keep only the first DIMS dimensions")
+    parser.add_argument('--classes', type=int, help="keep only the first CLASSES class rows")
+    args = parser.parse_args(argv)
+    if not args.input.endswith('.hdcm') and args.input.count(',') != 1:
+        parser.error("input must be a .hdcm model or two files as 'model,codebook', got %r" % args.input)
+
+    model, codebook = load_tables(args.input)
+    for name, value, limit in (('dims', args.dims, model.shape[1]), ('classes', args.classes, len(model))):
+        if value is not None and not 0 < value <= limit:
+            parser.error("--%s must be between 1 and %d" % (name, limit))
+    model = model[:args.classes, :args.dims]
+    codebook = codebook[:, :args.dims]
+
+    if args.format == 'header':
+        npy2header(model, codebook, args.output or 'model/model.h', args.word_bits)
+    elif args.format == 'blob':
+        npy2blob(model, codebook, args.output or 'model/model.bin', args.word_bits)
+    else:
+        npy2model(model, codebook, args.output or 'model/mnist_%d_%d.hdcm' % model.shape, args.word_bits)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #include <stdio.h>
+#include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
 #include <time.h>
@@ -9,6 +10,16 @@
 #define LOAD 1
 #define STORE 0
 
+// Model container, see mnist/hdc/model.py for the layout
+#define MODEL_MAGIC "HDCM"
+#define MODEL_VERSION 1
+#define MODEL_HEADER_SIZE 64
+#define MODEL_ALIGN 64
+#define MODEL_WORD_BITS 64
+
+// Dimensions of the loaded model, taken from its header; N_DIM for a new model
+int n_dim = N_DIM;
+
 typedef struct Image {
     int pixels[IMAGE_SIZE][IMAGE_SIZE];
     int label;
@@ -16,8 +27,9 @@ typedef struct Image {
 
 uint8_t** allocate_table(int x, int y);
 void free_table(uint8_t** table, int rows);
-uint8_t** load_table(char* name, int row, int column);
-void store_table(uint8_t** table, char* name, int row, int column);
+int load_model(char* name, uint8_t*** position_table, uint8_t*** item_memory);
+int store_model(char* name, uint8_t** position_table, uint8_t** item_memory);
+uint32_t crc32(const uint8_t* data, size_t length);
 int predict(int image[IMAGE_SIZE][IMAGE_SIZE], uint8_t** position_table, uint8_t** item_memory);
 uint8_t* encode(int image[IMAGE_SIZE][IMAGE_SIZE], uint8_t** position_table);
 void bind(uint8_t* x1, uint8_t* x2, uint8_t* result);
@@ -25,19 +37,20 @@ void bundle(uint8_t** xs, uint8_t* result, int length);
 void permute(uint8_t* x, int length);
 double distance(uint8_t* x1, uint8_t* x2);
 
-// Main function to test the initialize function
-int main() {
+// Main function to test the initialize function, optionally on the model given as argument
+int main(int argc, char** argv) {
     // Table for HDC
     uint8_t** position_table;
     uint8_t** item_memory;
 
     // Load array
     if (LOAD) {
-        position_table = load_table("model/codebook_56_10000.data", IMAGE_SIZE * 2, N_DIM);
-        item_memory = load_table("model/model_10_10000.data", IMAGE_SIZE * 2, N_DIM);
+        if (load_model(argc > 1 ? argv[1] : "model/mnist_10_10000.hdcm", &position_table, &item_memory) != 0) {
+            return 1;
+        }
     } else {
-        position_table = allocate_table(IMAGE_SIZE * 2, N_DIM);
-        item_memory = allocate_table(N_CLASS, N_DIM);
+        position_table = allocate_table(IMAGE_SIZE * 2, n_dim);
+        item_memory = allocate_table(N_CLASS, n_dim);
     }
 
     for (int i = 0; i < 10; i++) {
@@ -62,8 +75,7 @@ int main() {
 
     // Store array
     if (STORE) {
-        store_table(position_table, "position_table.data", IMAGE_SIZE * 2, N_DIM);
-        store_table(item_memory, "item_memory.data", N_CLASS, N_DIM);
+        store_model("model.hdcm", position_table, item_memory);
     }
     
     // Freeing dynamically allocated memory
@@ -101,56 +113,159 @@ void free_table(uint8_t** table, int rows) {
     free(table); // Free the array of pointers
 }
 
-// Function to load a table from a binary file
-uint8_t** load_table(char* name, int row, int column) {
+// Little-endian field readers/writers for the model header
+static uint64_t read_le(const uint8_t* p, int bytes) {
+    uint64_t v = 0;
+    for (int i = bytes - 1; i >= 0; i--) {
+        v = (v << 8) | p[i];
+    }
+    return v;
+}
+
+static void write_le(uint8_t* p, uint64_t v, int bytes) {
+    for (int i = 0; i < bytes; i++) {
+        p[i] = (uint8_t)(v >> (8 * i));
+    }
+}
+
+// Bytes per bit-packed row, rounded up to whole words
+static size_t row_bytes(int dims, int word_bits) {
+    return ((size_t)dims + word_bits - 1) / word_bits * word_bits / 8;
+}
+
+// Function to compute the CRC-32 (zlib polynomial) of a buffer
+uint32_t crc32(const uint8_t* data, size_t length) {
+    uint32_t crc = 0xFFFFFFFF;
+    for (size_t i = 0; i < length; i++) {
+        crc ^= data[i];
+        for (int k = 0; k < 8; k++) {
+            crc = (crc >> 1) ^ (0xEDB88320 & (0 - (crc & 1)));
+        }
+    }
+    return ~crc;
+}
+
+// Function to unpack bit-packed rows into a table with one byte per bit
+static uint8_t** unpack_table(const uint8_t* section, int rows, size_t stride) {
+    uint8_t** table = (uint8_t**)malloc(rows * sizeof(uint8_t*));
+    for (int i = 0; i < rows; i++) {
+        table[i] = (uint8_t*)malloc(n_dim * sizeof(uint8_t));
+        for (int k = 0; k < n_dim; k++) {
+            table[i][k] = (section[i * stride + k / 8] >> (k % 8)) & 1;
+        }
+    }
+    return table;
+}
+
+// Function to load the position table and item memory from a model container
+int load_model(char* name, uint8_t*** position_table, uint8_t*** item_memory) {
     // Open the binary file for reading
     FILE* file = fopen(name, "rb");
     if (!file) {
         fprintf(stderr, "Failed to open the file for reading.\n");
-        return 0;
+        return -1;
     }
 
-    // Read the dimensions (number of rows and columns) from the file
-    fread(&row, sizeof(int), 1, file);
-    fread(&column, sizeof(int), 1, file);
+    // Read the whole file
+    fseek(file, 0, SEEK_END);
+    long size = ftell(file);
+    fseek(file, 0, SEEK_SET);
+    uint8_t* data = (uint8_t*)malloc(size);
+    if (size < MODEL_HEADER_SIZE || fread(data, 1, size, file) != (size_t)size) {
+        fprintf(stderr, "Truncated model file.\n");
+        fclose(file);
+        free(data);
+        return -1;
+    }
+    fclose(file);
 
-    // Allocate memory for the 2D array
-    uint8_t** table = (uint8_t**)malloc(row * sizeof(uint8_t*));
-    for (int i = 0; i < row; i++) {
-        table[i] = (uint8_t*)malloc(column * sizeof(uint8_t));
+    // Check the header against the classes and codebook this runtime was built for
+    int header_size = read_le(data + 6, 2);
+    int dims = read_le(data + 8, 4);
+    int n_classes = read_le(data + 12, 4);
+    int n_codebook = read_le(data + 16, 4);
+    int word_bits = read_le(data + 20, 2);
+    uint64_t codebook_offset = read_le(data + 24, 8);
+    uint64_t model_offset = read_le(data + 32, 8);
+    uint32_t checksum = read_le(data + 40, 4);
+    int known_words = word_bits == 8 || word_bits == 16 || word_bits == 32 || word_bits == 64;
+    size_t stride = known_words && dims > 0 ? row_bytes(dims, word_bits) : 0;
+
+    int error = 0;
+    if (memcmp(data, MODEL_MAGIC, 4) != 0 || read_le(data + 4, 2) > MODEL_VERSION) {
+        fprintf(stderr, "Not a supported model file.\n");
+        error = 1;
+    } else if (header_size != MODEL_HEADER_SIZE || header_size > size) {
+        fprintf(stderr, "Bad model header size %d.\n", header_size);
+        error = 1;
+    } else if (!known_words) {
+        fprintf(stderr, "Unsupported model word size %d.\n", word_bits);
+        error = 1;
+    } else if (dims <= 0 || n_classes != N_CLASS || n_codebook != IMAGE_SIZE * 2) {
+        fprintf(stderr, "Model is %dx%d with %d codebook rows, expected %d classes with %d.\n",
+                n_classes, dims, n_codebook, N_CLASS, IMAGE_SIZE * 2);
+        error = 1;
+    } else if (codebook_offset > (uint64_t)size || n_codebook * stride > size - codebook_offset ||
+               model_offset > (uint64_t)size || n_classes * stride > size - model_offset) {
+        fprintf(stderr, "Truncated model file.\n");
+        error = 1;
+    } else if (crc32(data + header_size, size - header_size) != checksum) {
+        fprintf(stderr, "Model checksum mismatch.\n");
+        error = 1;
     }
 
-    // Read the 2D array data from the file
-    for (int i = 0; i < row; i++) {
-        fread(table[i], sizeof(uint8_t), column, file);
+    if (!error) {
+        n_dim = dims;
+        *position_table = unpack_table(data + codebook_offset, n_codebook, stride);
+        *item_memory = unpack_table(data + model_offset, n_classes, stride);
     }
+    free(data);
+    return error ? -1 : 0;
+}
 
-    // Close the file
-    fclose(file);
+// Function to save the position table and item memory into a model container
+int store_model(char* name, uint8_t** position_table, uint8_t** item_memory) {
+    size_t stride = row_bytes(n_dim, MODEL_WORD_BITS);
+    uint64_t codebook_offset = MODEL_HEADER_SIZE;
+    uint64_t model_offset = codebook_offset + IMAGE_SIZE * 2 * stride;
+    model_offset = (model_offset + MODEL_ALIGN - 1) / MODEL_ALIGN * MODEL_ALIGN;
+    size_t size = model_offset + N_CLASS * stride;
+
+    // Pack one bit per dimension, bit k in bit k % 8 of byte k / 8
+    uint8_t* data = (uint8_t*)calloc(size, 1);
+    for (int i = 0; i < IMAGE_SIZE * 2; i++) {
+        for (int k = 0; k < n_dim; k++) {
+            data[codebook_offset + i * stride + k / 8] |= (position_table[i][k] & 1) << (k % 8);
+        }
+    }
+    for (int i = 0; i < N_CLASS; i++) {
+        for (int k = 0; k < n_dim; k++) {
+            data[model_offset + i * stride + k / 8] |= (item_memory[i][k] & 1) << (k % 8);
+        }
+    }
 
-    return table;
-}
+    memcpy(data, MODEL_MAGIC, 4);
+    write_le(data + 4, MODEL_VERSION, 2);
+    write_le(data + 6, MODEL_HEADER_SIZE, 2);
+    write_le(data + 8, n_dim, 4);
+    write_le(data + 12, N_CLASS, 4);
+    write_le(data + 16, IMAGE_SIZE * 2, 4);
+    write_le(data + 20, MODEL_WORD_BITS, 2);
+    write_le(data + 24, codebook_offset, 8);
+    write_le(data + 32, model_offset, 8);
+    write_le(data + 40, crc32(data + MODEL_HEADER_SIZE, size - MODEL_HEADER_SIZE), 4);
 
-// Function to save a table into a binary file
-void store_table(uint8_t** table, char* name, int row, int column) {
     // Open a binary file for writing
     FILE* file = fopen(name, "wb");
     if (!file) {
         fprintf(stderr, "Failed to open the file for writing.\n");
-        return ;
+        free(data);
+        return -1;
     }
-
-    // Write the dimensions (number of rows and columns) to the file
-    fwrite(&row, sizeof(int), 1, file);
-    fwrite(&column, sizeof(int), 1, file);
-
-    // Write the 2D array data to the file
-    for (int i = 0; i < row; i++) {
-        fwrite(table[i], sizeof(uint8_t), column, file);
-    }
-
-    // Close the file
+    fwrite(data, 1, size, file);
     fclose(file);
+    free(data);
+    return 0;
 }
 
 // Function to predict the class label of given image
@@ -175,32 +290,32 @@ int predict(int image[IMAGE_SIZE][IMAGE_SIZE], uint8_t** position_table, uint8_t
 
 // Function to encode the image by converting it to a hyperdimensional vector
 uint8_t* encode(int image[IMAGE_SIZE][IMAGE_SIZE], uint8_t** position_table) {
-    uint8_t** hv_all = (uint8_t**)malloc(sizeof(uint8_t*) * (IMAGE_SIZE * IMAGE_SIZE)); // [IMAGE_SIZE * IMAGE_SIZE][N_DIM]
+    uint8_t** hv_all = (uint8_t**)malloc(sizeof(uint8_t*) * (IMAGE_SIZE * IMAGE_SIZE)); // [IMAGE_SIZE * IMAGE_SIZE][n_dim]
     for (int i = 0; i < IMAGE_SIZE * IMAGE_SIZE; i++) {
-        hv_all[i] = (uint8_t*)malloc(sizeof(uint8_t) * N_DIM);
+        hv_all[i] = (uint8_t*)malloc(sizeof(uint8_t) * n_dim);
     }
+    uint8_t* hv = (uint8_t*)malloc(sizeof(uint8_t) * n_dim);
     
     // Encode pixel values
     for (int i = 0; i < IMAGE_SIZE; i++) {
         for (int j = 0; j < IMAGE_SIZE; j++) {
-            uint8_t hv[N_DIM];
             int v = image[i][j];
             bind(position_table[i], position_table[IMAGE_SIZE + j], hv);
 
             // Permute if white, leave if black
             if (v > 0) {
-                permute(hv, N_DIM);
+                permute(hv, n_dim);
             }
 
             // Copy results
-            for (int k = 0; k < N_DIM; k++) {
+            for (int k = 0; k < n_dim; k++) {
                 hv_all[i * IMAGE_SIZE + j][k] = hv[k];
             }
         }
     }
 
     // Gather all pixel encoding to create one image encoding
-    uint8_t* result = (uint8_t*)malloc(sizeof(uint8_t) * N_DIM);
+    uint8_t* result = (uint8_t*)malloc(sizeof(uint8_t) * n_dim);
     bundle(hv_all, result, IMAGE_SIZE * IMAGE_SIZE);
 
     // Free dynamically allocated memory
@@ -208,20 +323,21 @@ uint8_t* encode(int image[IMAGE_SIZE][IMAGE_SIZE], uint8_t** position_table) {
         free(hv_all[i]);
     }
     free(hv_all);
+    free(hv);
 
     return result;
 }
 
 // Function to perform bitwise XOR operation on two arrays
 void bind(uint8_t* x1, uint8_t* x2, uint8_t* result) {
-    for (int i = 0; i < N_DIM; i++) {
+    for (int i = 0; i < n_dim; i++) {
         result[i] = x1[i] ^ x2[i];
     }
 }
 
 // Function to bundle an array of arrays (2D array)
 void bundle(uint8_t** xs, uint8_t* result, int length) {
-    for (int i = 0; i < N_DIM; i++) {
+    for (int i = 0; i < n_dim; i++) {
         int sum = 0;
         for (int j = 0; j < length; j++) {
             sum += xs[j][i];
@@ -242,9 +358,9 @@ void permute(uint8_t* x, int length) {
 // Function to calculate distance between two arrays
 double distance(uint8_t* x1, uint8_t* x2) {
     int sum = 0;
-    for (int i = 0; i < N_DIM; i++) {
+    for (int i = 0; i < n_dim; i++) {
         sum += (x1[i] ^ x2[i]);
     }
-    return (double)sum / N_DIM;
+    return (double)sum / n_dim;
 }
 
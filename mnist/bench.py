@@ -0,0 +1,173 @@
+"""
+Throughput and peak memory of the HDC primitives, the encoders, item memory search,
+HDDatabase and end-to-end MNIST training / classification. Everything runs offline on
+synthetic MNIST-shaped data and the results are written as JSON, so runs on different
+commits can be diffed.
+
+    python bench.py --json bench.json
+    python bench.py --quick --groups primitives memory --layouts packed
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+from hdc import *
+
+
+def load_script(name, path):
+    # the scripts have dashes in their names, so they are loaded by path
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__) or '.', path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def measure(group, name, fxn, items, repeat=3, **params):
+    # best wall time of <repeat> runs, and the peak traced allocation of one run
+    fxn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fxn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fxn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(group=group, name=name, packed=HDC.PACKED, dims=HDC.SIZE, items=items, seconds=best,
+                per_second=items / best if best > 0 else float('inf'), peak_bytes=peak, **params)
+
+def synthetic_mnist(n, classes=10, noise=0.1, seed=0):
+    # (n, 28, 28) 0 / 255 images: one random template per class with <noise> of the
+    # pixels flipped, so the classes are learnable
+    rng = np.random.default_rng(seed)
+    templates = rng.random((classes, 28, 28)) < 0.2
+    labels = rng.integers(classes, size=n)
+    images = templates[labels] ^ (rng.random((n, 28, 28)) < noise)
+    return images.astype(np.uint8) * 255, labels
+
+def synthetic_rows(rows, fields, values, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(values, size=(rows, fields))
+    return [("row%d" % r, {"f%d" % f: "v%d_%d" % (f, picks[r, f]) for f in range(fields)}) for r in range(rows)]
+
+def bench_primitives(n):
+    x, y = HDC.rand_vec(n), HDC.rand_vec(n)
+    return [measure("primitives", "bind", lambda: HDC.bind(x, y), n),
+            measure("primitives", "bundle", lambda: HDC.bundle(x), n),
+            measure("primitives", "permute", lambda: HDC.permute(x, 1), n),
+            measure("primitives", "dist", lambda: HDC.dist(x, y), n),
+            measure("primitives", "dist_matrix", lambda: HDC.dist_matrix(x[:64], y), 64 * n),
+            measure("primitives", "apply_bit_flips", lambda: HDC.apply_bit_flips(x, 0.01), n, p=0.01)]
+
+def bench_encode(n):
+    images, _ = synthetic_mnist(n)
+    codebook = HDCodebook("pixels")
+    codebook.add_many(['x%d' % i for i in range(28)] + ['y%d' % j for j in range(28)])
+    encoder = HDImageEncoder(codebook.vectors()[:28], codebook.vectors()[28:])
+    hvs = encoder.encode_batch(images)
+    return [measure("encode", "encode_batch", lambda: encoder.encode_batch(images), n),
+            measure("encode", "encode", lambda: encoder.encode(images[0]), 1),
+            measure("encode", "decode_batch", lambda: encoder.decode_batch(hvs), n)]
+
+def bench_memory(entries, queries):
+    res = []
+    for n in entries:
+        memory = HDCodebook("bench")
+        memory.add_many(list(range(n)))
+        batch = HDC.apply_bit_flips(memory.vectors()[np.arange(queries) % n], 0.2)
+        res += [measure("memory", "wta", lambda: memory.wta(batch), queries, entries=n),
+                measure("memory", "matches", lambda: memory.matches(batch, 0.4), queries, entries=n)]
+        memory.early_exit = 0.99
+        res.append(measure("memory", "wta_early_exit", lambda: memory.wta(batch), queries, entries=n))
+    return res
+
+def bench_database(rows, fields, values):
+    data = synthetic_rows(rows, fields, values)
+    db = HDDatabase()
+    db.bulk_load(data)
+    keys = [key for key, _ in data[:256]]
+    query = dict(list(data[0][1].items())[:2])
+    return [measure("database", "bulk_load", lambda: HDDatabase().bulk_load(data), rows, repeat=1, fields=fields),
+            measure("database", "get_rows", lambda: db.get_rows(keys), len(keys), fields=fields),
+            measure("database", "get_value", lambda: db.get_value(keys[0], "f0"), 1, fields=fields),
+            measure("database", "get_matches", lambda: db.get_matches(query, 0.4), 1, fields=fields)]
+
+def bench_end_to_end(n):
+    hdcml = load_script("hdc_ml", "hdc-ml.py")
+    images, labels = synthetic_mnist(n)
+    split = int(0.6 * n)
+    classifier = hdcml.MNISTClassifier()
+
+    def train():
+        counts = classifier.count_batch(images[:split], labels[:split])
+        classifier.classifier = HDItemMem()
+        classifier.fit_counts(counts)
+
+    train()
+    predicted, _ = classifier.predict_batch(images[split:])
+    accuracy = float(np.mean(predicted == labels[split:]))
+    return [measure("end_to_end", "train", train, split, repeat=1),
+            measure("end_to_end", "classify", lambda: classifier.predict_batch(images[split:]), n - split,
+                    accuracy=accuracy)]
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__) or '.').stdout.strip() or None
+    except OSError:
+        return None
+
+GROUPS = ['primitives', 'encode', 'memory', 'database', 'end_to_end']
+
+def run(groups=GROUPS, layouts=('packed', 'unpacked'), dims=(10000,), quick=False, seed=0):
+    scale = 0.1 if quick else 1.0
+    size = lambda n: max(1, int(n * scale))
+    results = []
+    for layout in layouts:
+        for d in dims:
+            HDC.SIZE, HDC.PACKED = d, layout == 'packed'
+            HDC.seed(seed)
+            if 'primitives' in groups:
+                results += bench_primitives(size(1000))
+            if 'encode' in groups:
+                results += bench_encode(size(1000))
+            if 'memory' in groups:
+                results += bench_memory([size(1000), size(10000)], size(200))
+            if 'database' in groups:
+                results += bench_database(size(2000), 10, 50)
+            if 'end_to_end' in groups:
+                results += bench_end_to_end(size(5000))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=GROUPS)
+    parser.add_argument('--layouts', nargs='+', choices=['packed', 'unpacked'], default=['packed', 'unpacked'])
+    parser.add_argument('--dims', type=int, nargs='+', default=[10000])
+    parser.add_argument('--quick', action='store_true', help="a tenth of the default sizes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.groups, args.layouts, args.dims, args.quick, args.seed)
+    print("%-11s %-16s %6s %6s %8s %12s %10s  %s" % ("group", "name", "packed", "dims", "items", "per second",
+                                                    "peak MB", "params"))
+    common = {"group", "name", "packed", "dims", "items", "seconds", "per_second", "peak_bytes"}
+    for r in results:
+        params = " ".join("%s=%s" % (k, v) for k, v in r.items() if k not in common)
+        print("%-11s %-16s %6s %6d %8d %12.1f %10.1f  %s" % (r["group"], r["name"], r["packed"], r["dims"], r["items"],
+                                                         r["per_second"], r["peak_bytes"] / 2 ** 20, params))
+    if args.json:
+        report = dict(commit=git_commit(), numpy=np.__version__, python=platform.python_version(),
+                      machine=platform.machine(), quick=args.quick, results=results)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=float)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Recall / throughput of HDBitSampleIndex against the brute-force HDItemMem.wta scan.
+Queries are noisy copies of random codebook entries; recall is the fraction of queries
+for which the index returns the same winner as the full scan.
+
+    python bench_cleanup.py --entries 100000 --noise 0.2 --tables 16 32 64 --bits 8 12
+"""
+import argparse
+import json
+import time
+import numpy as np
+from hdc import *
+
+
+def timed(fxn):
+    start = time.perf_counter()
+    res = fxn()
+    return res, time.perf_counter() - start
+
+def run(entries, queries, noise, tables, bits, seed=0):
+    HDC.seed(seed)
+    HDC.SIZE = 10000
+    HDC.PACKED = True
+    codebook = HDCodebook("bench")
+    codebook.add_many(list(range(entries)))
+    targets = HDC.rng.integers(entries, size=queries)
+    batch = HDC.apply_bit_flips(codebook.vectors()[targets], noise)
+
+    exact, elapsed = timed(lambda: codebook.wta(batch))
+    exact = np.array([key for key, _ in exact])
+    results = [dict(method="brute-force", entries=entries, noise=noise, qps=queries / elapsed,
+                    recall=1.0, accuracy=float(np.mean(exact == targets)), candidates=entries)]
+
+    for t in tables:
+        for b in bits:
+            index = HDBitSampleIndex(tables=t, bits=b)
+            codebook.set_cleanup(index)
+            _, build = timed(lambda: codebook.wta(batch[0]))
+            approx, elapsed = timed(lambda: codebook.wta(batch))
+            approx = np.array([key for key, _ in approx])
+            results.append(dict(method="lsh", tables=t, bits=b, entries=entries, noise=noise,
+                                qps=queries / elapsed, build_seconds=build,
+                                recall=float(np.mean(approx == exact)),
+                                accuracy=float(np.mean(approx == targets)),
+                                candidates=float(np.mean([len(c) for c in index.candidates(batch)]))))
+            codebook.set_cleanup(None)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.2, help="per-bit flip probability of the queries")
+    parser.add_argument('--tables', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--bits', type=int, nargs='+', default=[8, 12])
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.entries, args.queries, args.noise, args.tables, args.bits)
+    print("%-12s %6s %4s %10s %8s %11s" % ("method", "tables", "bits", "qps", "recall", "candidates"))
+    for r in results:
+        print("%-12s %6s %4s %10.1f %8.3f %11.1f" % (r["method"], r.get("tables", "-"), r.get("bits", "-"),
+                                                   r["qps"], r["recall"], r["candidates"]))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,106 @@
-from torchvision.datasets import MNIST
-from torch.utils.data import Subset
-import torch.utils
 import numpy as np
-import tqdm
-import itertools 
-import PIL
+import argparse
+import contextlib
+import time
+import PIL.Image
+from hdc import HDC, HDImageEncoder, HDEncodingCache, dataset_indices, dataset_batches, dataset_identity
+from hdc.data import load_mnist, split, read_inputs
+from hdc.model import save_model, load_model, unpack_rows, codebook_keys, seeded_codebook
+from hdc.extras import progress
+from hdc import instrument
 
 IMAGE_SIZE = 28 # MNIST image size
 N_CLASS = 10    # MNIST class label
 N_DIM = 10000    # HV dimension
 
-def initialize(N=1000):
-    alldata = MNIST(root='data', train=True, download=True)
-    dataset = list(map(lambda datum: (datum[0].convert("1"), datum[1]),  \
-                Subset(alldata, range(N))))
-    train_data, test_data = torch.utils.data.random_split(dataset, [0.6,0.4])
+def initialize(N=1000, seed=None):
+    train_data, test_data = split(load_mnist('data', N=N), [0.6, 0.4], seed)
     print("================ MNIST Data Loaded ===============")
     return train_data, test_data
 
-def bind(x1, x2):
-    return np.bitwise_xor(x1, x2)
-
-def bundle(xs):
-    return 1 * (np.sum(xs, axis=0) >= (len(xs) / 2))
-
-def distance(x1, x2):
-    return np.divide(np.sum(np.bitwise_xor(x1, x2)), N_DIM)
-
-def encode(image, position_table):
-    img_hv = []
-    for i, j in itertools.product(range(IMAGE_SIZE), range(IMAGE_SIZE)):
-        v = image.getpixel((i, j))
-        hv = bind(position_table[i], position_table[IMAGE_SIZE + j]) # position encoding
-        if v > 0: # white pixel
-            hv = np.roll(hv, 1) # value encoding
-        img_hv.append(hv)
-    return bundle(img_hv)
+@contextlib.contextmanager
+def unpacked(dims):
+    # run the package one int per bit at <dims> dimensions, as this script stores its
+    # hypervectors, and restore the previous settings afterwards
+    prev = HDC.SIZE, HDC.PACKED
+    HDC.SIZE, HDC.PACKED = dims, False
+    try:
+        yield
+    finally:
+        HDC.SIZE, HDC.PACKED = prev
+
+_encoder = {}
+
+def image_encoder(position_table):
+    # HDImageEncoder of the position table (x_0..x_27 then y_0..y_27), built once per table
+    if _encoder.get('table') is not position_table:
+        with unpacked(position_table.shape[1]):
+            _encoder.update(table=position_table,
+                            encoder=HDImageEncoder(position_table[:IMAGE_SIZE], position_table[IMAGE_SIZE:]))
+    return _encoder['encoder']
+
+_encoding_cache = {}
+
+def use_encoding_cache(position_table, source=None, path='encodings', max_bytes=1 << 30):
+    # reuse encodings made with this position table across runs, keyed by dataset index
+    # within the dataset identified by source (see dataset_identity)
+    with unpacked(position_table.shape[1]):
+        fingerprint = HDEncodingCache.fingerprint_of(position_table.astype(np.uint8), source=source)
+        _encoding_cache.update(table=position_table, cache=HDEncodingCache(fingerprint, path, max_bytes))
+
+def encode_batch(images, position_table, indices=None):
+    # (N, dims) 0/1 encodings of PIL images or an (N, 28, 28) array
+    encoder = image_encoder(position_table)
+    with unpacked(position_table.shape[1]):
+        if indices is not None and _encoding_cache.get('table') is position_table:
+            return _encoding_cache['cache'].encode(indices, images, encoder.encode_batch)
+        return encoder.encode_batch(images)
+
+def encode(image, position_table, index=None):
+    return encode_batch([image], position_table, None if index is None else [index])[0]
+
+def decode_batch(image_hvs, position_table):
+    # (N, 28, 28) images of 0 / 255, see HDImageEncoder.decode_batch
+    encoder = image_encoder(position_table)
+    with unpacked(position_table.shape[1]):
+        return encoder.decode_batch(image_hvs)
 
 def decode(image_hv, position_table):
-    image = PIL.Image.new(mode="1", size=(IMAGE_SIZE, IMAGE_SIZE))
-    for i, j in list(itertools.product(range(IMAGE_SIZE), range(IMAGE_SIZE))):
-        hv = bind(position_table[i], position_table[IMAGE_SIZE + j])
-        hv_perm = np.roll(hv, 1)
-        v = 0 if distance(hv, image_hv) < distance(hv_perm, image_hv) else 255
-        image.putpixel((i, j), v)
-    return image
+    return PIL.Image.fromarray(decode_batch(image_hv, position_table)[0]).convert("1")
 
 def train(item_memory, position_table, train_data):
     item_memory_ = item_memory.copy()
-    datasets = {}
-
-    for image, label in tqdm.tqdm(list(train_data)):
-        hv_image = encode(image, position_table)
-        if label not in datasets.keys():
-            datasets[label] = []
-        datasets[label].append(hv_image)
+    # per-class bit counts instead of lists of image hypervectors
+    counts = np.zeros(item_memory.shape, dtype=np.int64)
+    totals = np.zeros(len(item_memory), dtype=np.int64)
+
+    for images, labels, indices in progress(dataset_batches(train_data)):
+        hv_images = encode_batch(images, position_table, indices)
+        for label in np.unique(labels):
+            counts[label] += hv_images[labels == label].sum(axis=0)
+        totals += np.bincount(labels, minlength=len(item_memory))
         
-    for label in datasets.keys():
-        label_hv = bundle(datasets[label])
-        item_memory_[label] = label_hv
+    for label in np.flatnonzero(totals):
+        item_memory_[label] = 1 * (counts[label] >= totals[label] / 2)
     
     return item_memory_
 
-def predict(item_memory, position_table, image):
-    result = []
-    hv_image = encode(image, position_table)
-    for i in range(len(item_memory)): # i = class label
-        result.append(distance(item_memory[i], hv_image))
-    label = np.argmin(result)
-    return label, result[label]
+@instrument.timed()
+def predict_batch(item_memory, position_table, images, indices=None):
+    # labels (N,) and class distances (N, N_CLASS) for PIL images or an (N, 28, 28) array
+    hv_images = encode_batch(images, position_table, indices)
+    with unpacked(item_memory.shape[1]):
+        dists = HDC.dist_matrix(hv_images, item_memory)
+    return np.argmin(dists, axis=1), dists
+
+def predict(item_memory, position_table, image, index=None):
+    labels, dists = predict_batch(item_memory, position_table, [image], None if index is None else [index])
+    return labels[0], dists[0, labels[0]]
 
 def test(item_memory, position_table, test_data):
     correct, count = 0, 0
-    for image, category in (pbar := tqdm.tqdm(test_data)):
-        cat, dist = predict(item_memory, position_table, image)
+    for (image, category), index in zip(pbar := progress(test_data), dataset_indices(test_data)):
+        cat, dist = predict(item_memory, position_table, image, index)
         if cat == category:
             correct += 1
         count += 1
@@ -81,35 +108,96 @@ def test(item_memory, position_table, test_data):
     print("ACCURACY: %f" % (float(correct)/count))
 
 
-def main(mode):
-    train_data, test_data = initialize()
+def make_position_table(seed=None):
+    # x_0..x_27 then y_0..y_27; with a seed the table is regenerated from the seed
+    # alone, the same way hdc.model.seeded_codebook does
+    if seed is None:
+        return HDC.rng.integers(2, size=(IMAGE_SIZE * 2, N_DIM))
+    return HDC.keyed_vecs(codebook_keys(IMAGE_SIZE * 2), seed, N_DIM, packed=False)
+
+def main(mode, model=None, seed=None, store_codebook=True):
+    HDC.seed(seed)
+    train_data, test_data = initialize(seed=seed)
     
     if mode == 'train':
         print("================ Training Begins ================")
-        position_table = np.random.randint(2, size=(IMAGE_SIZE * 2, N_DIM))
-        test_encoding(train_data[0][0], position_table)
-        item_memory = np.random.randint(2, size=(N_CLASS, N_DIM))
+        position_table = make_position_table(seed)
+        use_encoding_cache(position_table, dataset_identity(train_data))
+        test_encoding(train_data[0][0], position_table, dataset_indices(train_data)[0])
+        item_memory = HDC.rng.integers(2, size=(N_CLASS, N_DIM))
         item_memory = train(item_memory, position_table, train_data)
-        np.save('model_{}_{}'.format(N_CLASS, N_DIM), item_memory) # save model
-        np.save('codebook_{}_{}'.format(N_CLASS, N_DIM), position_table) # save codebook
-        print("Training successful. Saved model at model_{}_{}.npy".format(N_CLASS, N_DIM))
+        # save model and codebook
+        save_model('mnist_{}_{}.hdcm'.format(N_CLASS, N_DIM), item_memory, position_table,
+                   seed=seed, store_codebook=store_codebook)
+        print("Training successful. Saved model at mnist_{}_{}.hdcm".format(N_CLASS, N_DIM))
 
         print("================ Testing Begins ================")
         test(item_memory, position_table, test_data)
 
     elif mode == 'test':
-        item_memory = np.load('../embedded-hdc/model/model_{}_{}.npy'.format(N_CLASS, N_DIM))
-        position_table = np.load('../embedded-hdc/model/codebook_{}_{}.npy'.format(IMAGE_SIZE * 2, N_DIM))
+        item_memory, position_table = load(model)
+        use_encoding_cache(position_table, dataset_identity(test_data))
         test(item_memory, position_table, test_data)
 
     return 0
 
-def test_encoding(image, position_table):
-    hv_image = encode(image, position_table)
+def predict_files(model, inputs, labels=None, output=None, chunk=256, threshold=128):
+    # stream images from a .npy / IDX file through predict_batch in fixed-size chunks
+    item_memory, position_table = load(model)
+    images = read_inputs(inputs)
+    truth = None if labels is None else read_inputs(labels)
+    predicted = np.empty(len(images), dtype=np.int64)
+    start = time.perf_counter()
+    for i in progress(range(0, len(images), chunk)):
+        # grayscale inputs are binarized here; PIL "1" images are already 0/255
+        masks = np.asarray(images[i:i + chunk]) >= threshold
+        predicted[i:i + chunk], _ = predict_batch(item_memory, position_table, masks)
+    elapsed = time.perf_counter() - start
+    print("%d images in %.3fs, %.3f ms/image" % (len(images), elapsed, 1000 * elapsed / max(1, len(images))))
+    if truth is not None:
+        print("ACCURACY: %f" % np.mean(predicted == np.asarray(truth)))
+    if output:
+        np.save(output, predicted)
+    return predicted
+
+def load(path):
+    # item memory and position table of a model container, as 0/1 int arrays
+    header, item_memory, position_table = load_model(path)
+    position_table = seeded_codebook(header) if position_table is None else unpack_rows(position_table, header['dims'])
+    return (unpack_rows(item_memory, header['dims']).astype(np.int64), position_table.astype(np.int64))
+
+def test_encoding(image, position_table, index=None):
+    hv_image = encode(image, position_table, index)
     result = decode(hv_image, position_table)
-    image.save("sample0.png")
+    PIL.Image.fromarray(image).save("sample0.png")
     result.save("sample0_rec.png")
 
 if __name__ == '__main__':
-    mode = 'test'
-    main(mode)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', nargs='?', choices=['train', 'test', 'predict'], default='test')
+    parser.add_argument('--model', default='../embedded-hdc/model/mnist_{}_{}.hdcm'.format(N_CLASS, N_DIM),
+                        help="test, predict: the model file to evaluate")
+    parser.add_argument('--input', help="predict: (N, 28, 28) uint8 images as .npy or IDX")
+    parser.add_argument('--labels', help="predict: optional labels as .npy or IDX, to report accuracy")
+    parser.add_argument('--output', help="predict: save the predicted labels to this .npy")
+    parser.add_argument('--chunk', type=int, default=256)
+    parser.add_argument('--threshold', type=int, default=128, help="predict: white pixel threshold")
+    parser.add_argument('--seed', type=int, help="train: derive the position table and every random draw from this seed")
+    parser.add_argument('--no-codebook', action='store_true',
+                        help="train: store only the seed, not the position table (the C runtime needs the table)")
+    parser.add_argument('--profile', help="time the hot paths and write the snapshot to this .json")
+    args = parser.parse_args()
+    if args.no_codebook and args.seed is None:
+        parser.error("--no-codebook needs --seed")
+    if args.mode == 'predict' and not args.input:
+        parser.error("predict needs --input")
+    if args.profile:
+        instrument.enable()
+    if args.mode == 'predict':
+        predict_files(args.model, args.input, args.labels, args.output, args.chunk, args.threshold)
+    else:
+        main(args.mode, args.model, args.seed, not args.no_codebook)
+    if args.profile:
+        prof = instrument.disable()
+        print(prof.table())
+        prof.save(args.profile)
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+Shrink a trained model to fewer dimensions, see hdc/compress.py.
+
+    model  ranks the dimensions of an hdc-board.py .hdcm model on most of its training
+           split, sweeps accuracy on the rest of it against the number of dimensions
+           kept using the cached encodings, then retrains on the whole training split
+           and reports test accuracy and writes the model at the chosen width
+    db     sweeps get_value accuracy of an HDDatabase built from a CSV against its width
+           and pickles the database cut to the chosen width (hdc-serve.py --db serves it)
+
+    python hdc-compress.py model --model mnist_10_10000.hdcm --output mnist_10_small.hdcm
+    python hdc-compress.py db --db digimon.csv --dims 2048 --output digimon_2048.pkl
+"""
+import argparse
+import csv
+import json
+import pickle
+import numpy as np
+from hdc import HDC, HDDatabase, HDImageEncoder, HDEncodingCache, WORD_BITS, dataset_identity
+from hdc import compress
+from hdc.data import load_mnist, split
+from hdc.model import load_model, save_model, unpack_rows, seeded_codebook, codebook_keys
+from hdc.extras import progress
+
+IMAGE_SIZE = 28 # MNIST image size
+
+
+def word_multiple(text):
+    # argparse type of --dims and --widths, which are cut per 64-bit word
+    value = int(text)
+    if value <= 0 or value % WORD_BITS:
+        raise argparse.ArgumentTypeError("%s is not a positive multiple of %d" % (text, WORD_BITS))
+    return value
+
+def default_widths(dims):
+    # powers of two words up to the full width
+    widths, w = [], WORD_BITS
+    while w < dims:
+        widths.append(w)
+        w *= 2
+    return widths + [dims // WORD_BITS * WORD_BITS]
+
+def encode_split(data, position_table, cache=None, chunk=256):
+    # packed encodings and labels of a dataset at the width of the position table
+    positions = HDC.pack(position_table)
+    encoder = HDImageEncoder(positions[:IMAGE_SIZE], positions[IMAGE_SIZE:])
+    hvs, labels = [], []
+    for images, batch_labels, indices in progress(data.batches(chunk), total=-(-len(data) // chunk)):
+        hvs.append(encoder.encode_batch(images) if cache is None else cache.encode(indices, images, encoder.encode_batch))
+        labels.append(batch_labels)
+    return np.concatenate(hvs), np.concatenate(labels)
+
+def prototypes(hvs, labels, classes):
+    # per-class majority of the encodings, as hdc-board.py trains
+    counts, totals = compress.class_bit_counts(hvs, labels, classes)
+    return HDC.threshold(counts, np.maximum(totals, 1)[:, None])
+
+def accuracy(protos, hvs, labels):
+    return float(np.mean(np.argmin(HDC.hamming_matrix(hvs, protos), axis=1) == labels))
+
+def compress_model(path, output=None, dims=None, tolerance=0.005, widths=None, prefix=False, N=1000,
+                   seed=None, cache='encodings'):
+    header, _, position_table = load_model(path)
+    position_table = seeded_codebook(header) if position_table is None else unpack_rows(position_table, header['dims'])
+    classes = header['n_classes']
+    HDC.SIZE, HDC.PACKED = header['dims'], True
+    train_data, test_data = split(load_mnist('data', N=N), [0.6, 0.4], seed)
+    # the width is picked on a validation slice of the training split, so the test split
+    # only scores the chosen width. The stored model has seen that slice, the sweep uses
+    # prototypes of the rest instead.
+    fit_data, val_data = split(train_data, [0.8, 0.2], seed)
+    # the encoding cache of hdc-board.py, keyed the same way
+    fingerprint = HDEncodingCache.fingerprint_of(position_table.astype(np.uint8), source=dataset_identity(train_data))
+    cache = cache and HDEncodingCache(fingerprint, cache)
+    fit_hvs, fit_labels = encode_split(fit_data, position_table, cache)
+    val_hvs, val_labels = encode_split(val_data, position_table, cache)
+
+    counts, totals = compress.class_bit_counts(fit_hvs, fit_labels, classes)
+    order = compress.word_order(compress.dimension_scores(counts, totals), prefix)
+    model = HDC.threshold(counts, np.maximum(totals, 1)[:, None])
+    results = compress.sweep(model, val_hvs, val_labels, order, widths or default_widths(header['dims']))
+    print("%8s %10s %12s" % ("dims", "val acc", "model bytes"))
+    for r in results:
+        print("%8d %10.4f %12d" % (r['dims'], r['accuracy'], r['model_bytes']))
+    dims = dims or compress.pick_width(results, tolerance)
+
+    # retrain at the reduced width: the roll of the encoder makes its kept columns
+    # differ slightly from the kept columns of the full-width encodings
+    kept = compress.word_dims(order[:dims // WORD_BITS])
+    reduced_table = position_table[:, kept]
+    with compress.width(dims):
+        train_hvs, train_labels = encode_split(train_data, reduced_table)
+        test_hvs, test_labels = encode_split(test_data, reduced_table)
+        protos = prototypes(train_hvs, train_labels, classes)
+        report = dict(dims=dims, full_dims=header['dims'], accuracy=accuracy(protos, test_hvs, test_labels),
+                      sweep=results)
+        print("%d dims kept, retrained test accuracy %.4f" % (dims, report['accuracy']))
+        if output:
+            # a prefix of a seeded codebook is the seeded codebook at the smaller width
+            seeded = prefix and header['seed'] is not None and \
+                np.array_equal(reduced_table, HDC.keyed_vecs(codebook_keys(header['n_codebook']), header['seed'],
+                                                             dims, packed=False))
+            save_model(output, HDC.unpack(protos), reduced_table, word_bits=header['word_bits'],
+                       seed=header['seed'] if seeded else None)
+    return report
+
+def cell_accuracy(db, cells):
+    return float(np.mean([value == expected for value, (_, _, expected) in
+                          zip(db.get_value_batch([(key, field) for key, field, _ in cells]), cells)]))
+
+def compress_db(path, key, output=None, dims=None, tolerance=0.005, widths=None, seed=None, cells=2000):
+    HDC.SIZE, HDC.PACKED = 10000, True
+    HDC.seed(seed)
+    with open(path, "r") as csvf:
+        rows = [(row[key], row) for row in csv.DictReader(csvf)]
+    db = HDDatabase()
+    db.bulk_load(rows)
+    every = [(k, field, value) for k, row in rows for field, value in row.items()]
+    sample = [every[i] for i in HDC.rng.permutation(len(every))[:cells]]
+
+    # dimensions of a database are exchangeable, so the first ones are kept
+    results = []
+    for w in widths or default_widths(HDC.SIZE):
+        with compress.width(w):
+            results.append(dict(dims=w, accuracy=cell_accuracy(compress.truncate_database(db, w), sample),
+                                db_bytes=len(db.db.keys) * w // 8))
+    print("%8s %10s %12s" % ("dims", "accuracy", "table bytes"))
+    for r in results:
+        print("%8d %10.4f %12d" % (r['dims'], r['accuracy'], r['db_bytes']))
+    dims = dims or compress.pick_width(results, tolerance)
+    report = dict(dims=dims, full_dims=HDC.SIZE, sweep=results)
+    with compress.width(dims):
+        reduced = compress.truncate_database(db, dims)
+        if output:
+            with open(output, 'wb') as f:
+                pickle.dump(dict(size=dims, packed=True, db=reduced), f)
+    print("%d dims kept" % dims)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['model', 'db'])
+    parser.add_argument('--model', default='mnist_10_10000.hdcm', help="model: the trained .hdcm")
+    parser.add_argument('--db', default='digimon.csv', help="db: the CSV table")
+    parser.add_argument('--key', default='Digimon', help="db: primary key column of the CSV")
+    parser.add_argument('--output', help="write the reduced model (.hdcm) or database (.pkl) here")
+    parser.add_argument('--dims', type=word_multiple,
+                        help="dimensions to keep, a multiple of 64; picked from the sweep by default")
+    parser.add_argument('--tolerance', type=float, default=0.005, help="accuracy the picked width may lose")
+    parser.add_argument('--widths', type=word_multiple, nargs='+', help="widths to sweep, multiples of 64")
+    parser.add_argument('--prefix', action='store_true',
+                        help="model: keep the first dimensions instead of the best scored ones; "
+                             "keeps a seeded codebook regenerable")
+    parser.add_argument('--N', type=int, default=1000, help="model: MNIST images to train and test on")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', help="also write the sweep to this file")
+    args = parser.parse_args()
+    if args.mode == 'model':
+        report = compress_model(args.model, args.output, args.dims, args.tolerance, args.widths, args.prefix,
+                                args.N, args.seed)
+    else:
+        report = compress_db(args.db, args.key, args.output, args.dims, args.tolerance, args.widths, args.seed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -2,85 +2,20 @@ from hdc import *
 import csv
 
 
-class HDDatabase:
-
-    def __init__(self):
-        self.db = HDItemMem("db")
-        self.codebook = HDCodebook("string")
-        # raise Exception("other instantiations here")
-        
-    def encode_string(self,value):
-        if self.codebook.has(value):
-            return self.codebook.get(value)
-        else:
-            return self.codebook.add(value)
-        # raise Exception("translate a string to a hypervector") 
-        
-    def decode_string(self,hypervec):
-        return self.codebook.wta(hypervec)[0]
-        # raise Exception("translate a hypervector to a string") 
-
-    def encode_row(self, fields):
-        res = []
-        for k, v in fields.items():
-            hv = HDC.bind(self.encode_string(k), self.encode_string(v))
-            res.append(hv)
-        return HDC.bundle(res)
-        # raise Exception("translate a dictionary of field-value pairs to a hypervector") 
-        
-    def decode_row(self, hypervec):
-        res = {}
-        keys = ['Number', 'Digimon', 'Stage', 'Type', 'Attribute', 'Memory', 'Equip Slots', 'Lv 50 HP', 'Lv50 SP', 'Lv50 Atk', 'Lv50 Def', 'Lv50 Int', 'Lv50 Spd']
-        for key in keys:
-            key_hv = self.encode_string(key)
-            inverted_hv = HDC.bind(key_hv, hypervec)
-            value = self.codebook.wta(inverted_hv)[0]
-            res[key] = value
-        return res
-        # raise Exception("reconstruct a dictionary of field-value pairs from a hypervector.") 
-
-    def add_row(self, primary_key, fields):
-        row_hv = self.encode_row(fields)
-        self.db.add(primary_key, row_hv)
-
-    def get_row(self,key):
-        hv = self.db.get(key)
-        return self.decode_row(hv)
-        # raise Exception("retrieve a dictonary of field-value pairs from a hypervector row")
-
-    def get_value(self,key, field, ret_dist=False):
-        hv = self.db.get(key)
-        field_hv = self.encode_string(field)
-        return self.codebook.wta(HDC.bind(field_hv, hv))[0]
-        # raise Exception("given a primary key and a field, get the value assigned to the field")
-        
-    def get_matches(self, field_value_dict, threshold=0.4):
-        query = self.encode_row(field_value_dict)
-        return self.db.matches(query, threshold=threshold)
-        # raise Exception("get database entries that contain provided dictionary of field-value pairs")
-        
-    def get_analogy(self, target_key, other_key, target_value):
-        field = self.get_value(target_key, target_value)
-        return self.codebook.wta(HDC.bind(self.db.get(other_key), self.encode_string(field)))
-        # raise Exception("analogy query")
-
+def load_csv(path="digimon.csv", key="Digimon"):
+    # stream (primary key, row) pairs without holding the file in memory
+    with open(path,"r") as csvf:
+        for row in csv.DictReader(csvf):
+            yield row[key], row
 
 def load_json():
-    data = {}
-    with open("digimon.csv","r") as csvf:
-        csvReader = csv.DictReader(csvf)
-        for rows in csvReader:
-            key = rows['Digimon']
-            data[key] = rows
-    return data
+    return dict(load_csv())
 
 def build_database(data):
     HDC.SIZE = 10000
+    HDC.PACKED = True
     db = HDDatabase()
-
-    for key, fields in data.items():
-        db.add_row(key,fields)
-
+    db.bulk_load(data.items())
     return db
 
 def summarize_result(data,result, summary_fn):
@@ -1,26 +1,43 @@
-from torchvision.datasets import MNIST 
-from torch.utils.data import Subset
-import tqdm
-import torch.utils
+import random
+import numpy as np
 from hdc import *
-import itertools 
-import PIL
-import math
+from hdc.data import load_mnist, split
+from hdc.extras import progress
+from hdc import instrument
+import PIL.Image
+import os
+import copy
+import collections
+import multiprocessing
 
 MAX = 26
 DEBUG = 1
 TRAIN_STOP = 300
+CHUNK = 256
 
 class MNISTClassifier:
 
-    def __init__(self):
+    def __init__(self,seed=None):
         self.classifier = HDItemMem()
-        self.codebook = HDCodebook("pixels")
+        # with a seed the pixel codebook is the same in every run and every worker
+        self.codebook = HDCodebook("pixels", seed)
         for i in range(MAX):
             self.codebook.add('x' + str(i))
             self.codebook.add('y' + str(i))
+        self.encoder = self.make_encoder()
+        self.cache = None
         # raise Exception("initialize other stuff here")
 
+    def make_encoder(self):
+        return HDImageEncoder([self.codebook.get('x' + str(i)) for i in range(MAX)],
+                              [self.codebook.get('y' + str(j)) for j in range(MAX)])
+
+    def __getstate__(self):
+        # the encoder tables are derived from the codebook, workers rebuild them
+        state = self.__dict__.copy()
+        state['encoder'] = None
+        return state
+
     def encode_coord(self,i,j):
         hv_x = self.codebook.get('x' + str(i))
         hv_y = self.codebook.get('y' + str(j))
@@ -34,14 +51,33 @@ class MNISTClassifier:
         return hv
         # raise Exception("encode a pixel in the image as a hypervector")
 
-    def encode_image(self,image):
-        hv = []
-        for i,j in itertools.product(range(MAX),range(MAX)):
-            v = image.getpixel((i,j))
-            hv.append(self.encode_pixel(i,j,v))
-        return HDC.bundle(hv)
+    def use_cache(self,path='encodings',max_bytes=1 << 30,source=None):
+        # keep encodings on disk, valid for as long as the pixel codebook and the dataset
+        # the indices refer to (source, see dataset_identity) stay the same
+        positions = HDC.unpack(self.encoder.positions) if HDC.PACKED else self.encoder.positions
+        fingerprint = HDEncodingCache.fingerprint_of(positions.astype(np.uint8), source=source)
+        self.cache = HDEncodingCache(fingerprint, path, max_bytes)
+
+    def reserve_cache(self,data):
+        # size the cache files for the whole dataset before pool workers start writing to them
+        if self.cache is not None:
+            self.cache.reserve(max(dataset_indices(data), default=-1) + 1)
+
+    @instrument.timed()
+    def encode_image(self,image,index=None):
+        # index is the dataset index of the image, used as the encoding cache key
+        if index is not None:
+            return self.encode_images([image], [index])[0]
+        return self.encoder.encode(image)
         # raise Exception("return hypervector encoding of image")
 
+    @instrument.timed()
+    def encode_images(self,images,indices=None):
+        # batch version of encode_image, one row per image
+        if self.cache is None or indices is None:
+            return self.encoder.encode_batch(images)
+        return self.cache.encode(indices, images, self.encoder.encode_batch)
+
     def decode_pixel(self, image_hypervec, i, j):
         hv = self.encode_coord(i, j)
         hv_permuted = HDC.permute(hv, 1)
@@ -52,68 +88,224 @@ class MNISTClassifier:
         # raise Exception("retrieve the value of the pixel at coordinate i,j in the image hypervector")
 
     def decode_image(self, image_hypervec):
-        im = PIL.Image.new(mode="1", size=(MAX, MAX))
-        for i,j in list(itertools.product(range(MAX),range(MAX))):
-            v = self.decode_pixel(image_hypervec,i,j)
-            im.putpixel((i,j),v)
-        return im
+        return PIL.Image.fromarray(self.encoder.decode(image_hypervec)).convert("1")
+
+    def decode_images(self, hvs):
+        # N x MAX x MAX arrays of 0 / 255, see HDImageEncoder.decode_batch
+        return self.encoder.decode_batch(hvs)
+
+
+    def count_batch(self,images,labels,indices=None):
+        return self.count_encoded(self.encode_images(images, indices), labels)
+
+    def count_encoded(self,hvs,labels):
+        # {label: HDAccumulator} for a chunk, in order of first appearance
+        labels = np.asarray(labels)
+        counts = {}
+        for label in dict.fromkeys(labels.tolist()):
+            counts[label] = HDAccumulator()
+            counts[label].add(hvs[labels == label])
+        return counts
 
+    def fit_counts(self,counts):
+        # the class hypervector is the majority vote over all of its images
+        for label, acc in counts.items():
+            self.classifier.merge(label, acc)
+
+    def partial_fit(self,images,labels):
+        # fold a new batch of labelled images into the class prototypes
+        self.fit_counts(self.count_batch(images, labels))
 
     def train(self,train_data):
-        datasets = {}
-        for image,label in tqdm.tqdm(list(train_data)):
-            hv_image = self.encode_image(image)
-            if label not in datasets.keys():
-                datasets[label] = []
-            datasets[label].append(hv_image)
-            
-        for label in datasets.keys():
-            self.classifier.add(label, HDC.bundle(datasets[label]))
+        # from scratch; use partial_fit to keep updating a trained classifier
+        self.classifier = HDItemMem()
+        counts = {}
+        for images, labels, indices in progress(dataset_batches(train_data, CHUNK)):
+            merge_counts(counts, self.count_batch(images, labels, indices))
+        self.fit_counts(counts)
         # raise Exception("do something with the image,label pair from the dataset")
 
-    def classify(self,image):
-        hv_image = self.encode_image(image)
+    def train_parallel(self,train_data,processes=None):
+        # same result as train, with the dataset sharded across a process pool
+        processes = processes or os.cpu_count()
+        self.classifier = HDItemMem()
+        counts = {}
+        self.reserve_cache(train_data)
+        with make_pool(self, processes) as pool:
+            for chunk in progress(imap_bounded(pool, _count_batch, dataset_batches(train_data, CHUNK), 2 * processes)):
+                merge_counts(counts, chunk)
+        self.fit_counts(counts)
+
+    def encode_dataset(self,data):
+        # (N x D encodings, N labels) of a whole dataset, encoded once
+        hvs, labels = [], []
+        for images, chunk_labels, indices in progress(dataset_batches(data, CHUNK)):
+            hvs.append(self.encode_images(images, indices))
+            labels.extend(chunk_labels)
+        return np.concatenate(hvs), np.asarray(labels)
+
+    def predict_encoded(self,hvs):
+        # vectorized winner-take-all over a batch of encoded images: labels, N x classes distances
+        dists = self.classifier.distance_matrix(hvs)
+        keys = np.asarray(self.classifier.all_keys())
+        return keys[np.argmin(dists, axis=1)], dists
+
+    def retrain(self,train_data,epochs=10,validation=0.1,patience=2):
+        # one bundling pass, then perceptron-style epochs: every misclassified image is
+        # added to its true class and subtracted from the class it was mistaken for.
+        # stops once validation accuracy has not improved for <patience> epochs and
+        # keeps the best prototypes. returns the validation accuracy of every epoch.
+        hvs, labels = self.encode_dataset(train_data)
+        order = HDC.rng.permutation(len(labels))
+        n_val = int(len(labels) * validation)
+        val, fit = order[:n_val], order[n_val:]
+        if n_val == 0:
+            val = fit
+
+        self.classifier = HDItemMem()
+        self.fit_counts(self.count_encoded(hvs[fit], labels[fit]))
+        history = [np.mean(self.predict_encoded(hvs[val])[0] == labels[val])]
+        best, best_epoch = copy.deepcopy(self.classifier), 0
+
+        for epoch in range(1, epochs + 1):
+            predicted = self.predict_encoded(hvs[fit])[0]
+            wrong = fit[predicted != labels[fit]]
+            predicted = predicted[predicted != labels[fit]]
+            for label in self.classifier.all_keys():
+                self.classifier.accumulate(label, hvs[wrong[labels[wrong] == label]])
+                self.classifier.accumulate(label, hvs[wrong[predicted == label]], weight=-1)
+
+            history.append(np.mean(self.predict_encoded(hvs[val])[0] == labels[val]))
+            print("epoch %d: %d misclassified, validation accuracy=%f" % (epoch, len(wrong), history[-1]))
+            if history[-1] > history[best_epoch]:
+                best, best_epoch = copy.deepcopy(self.classifier), epoch
+            elif epoch - best_epoch >= patience or len(wrong) == 0:
+                break
+
+        self.classifier = best
+        return history
+
+    @instrument.timed()
+    def classify(self,image,index=None):
+        hv_image = self.encode_image(image, index)
         label, dist = self.classifier.wta(hv_image)
         # raise Exception("classify an image using your classifier and return the label and distance")
         return label,dist
 
+    @instrument.timed()
+    def classify_images(self,images,indices=None):
+        # [(label, dist)] for a batch of images
+        return self.classifier.wta(self.encode_images(images, indices))
+
+    def predict_batch(self,images,indices=None):
+        # labels (N,) and class distances (N, classes) for PIL images or an (N, 28, 28) array
+        return self.predict_encoded(self.encode_images(images, indices))
+
+    def count_correct(self,images,labels,indices=None):
+        predicted = self.classify_images(images, indices)
+        return sum(int(cat == label) for (cat, _), label in zip(predicted, labels)), len(labels)
+
+    def evaluate_parallel(self,test_data,processes=None):
+        processes = processes or os.cpu_count()
+        correct, count = 0, 0
+        self.reserve_cache(test_data)
+        with make_pool(self, processes) as pool:
+            chunks = imap_bounded(pool, _count_correct, dataset_batches(test_data, CHUNK), 2 * processes)
+            for c, n in (pbar := progress(chunks)):
+                correct += c
+                count += n
+                pbar.set_description("accuracy=%f" % (float(correct)/count))
+        return float(correct)/count
+
     def build_gen_model(self,train_data):
         self.gen_model = {}
-        for image,label in tqdm.tqdm(list(train_data)):
+        for image,label in progress(list(train_data)):
             raise Exception("build generative model") 
             
     def generate(self, cat, trials=10):
         gen_hv = self.gen_model[cat]
         raise Exception("generate random image with label <cat> using generative model. Average over <trials> trials.")
 
-def initialize(N=1000):
-    alldata = MNIST(root='data', train=True, download=True)
-    dataset = list(map(lambda datum: (datum[0].convert("1"), datum[1]),  \
-                Subset(alldata, range(N))))
-    train_data, test_data = torch.utils.data.random_split(dataset, [0.6,0.4])
+def merge_counts(counts, other):
+    for label, acc in other.items():
+        if label in counts:
+            counts[label].merge(acc)
+        else:
+            counts[label] = acc
+
+# worker side of train_parallel / evaluate_parallel. every worker gets its own copy
+# of the classifier once, then only image chunks and counts cross process boundaries.
+_worker = None
+
+def _init_worker(classifier, size, packed):
+    global _worker
+    HDC.SIZE, HDC.PACKED = size, packed
+    _worker = classifier
+    if _worker.encoder is None:
+        _worker.encoder = _worker.make_encoder()
+
+def _count_batch(batch):
+    return _worker.count_batch(*batch)
+
+def _count_correct(batch):
+    return _worker.count_correct(*batch)
+
+def make_pool(classifier, processes):
+    return multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(classifier, HDC.SIZE, HDC.PACKED))
+
+def imap_bounded(pool, fxn, chunks, window):
+    # ordered pool.imap that keeps at most <window> chunks in flight, so memory
+    # stays flat however large the dataset is
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(fxn, (chunk,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def initialize(N=1000, cache=None, seed=None):
+    train_data, test_data = split(load_mnist('data', N=N), [0.6, 0.4], seed)
     HDC.SIZE = 10000
-    classifier = MNISTClassifier()
+    HDC.PACKED = True
+    HDC.seed(seed)
+    classifier = MNISTClassifier(seed)
+    if cache:
+        # train and test are splits of one file, so one cache serves both
+        classifier.use_cache(cache, source=dataset_identity(train_data))
     return train_data, test_data, classifier
 
-def test_encoding():
-    train_data, test_data, classifier = initialize()
+def test_encoding(cache=None):
+    train_data, test_data, classifier = initialize(cache=cache)
     image0,_ = train_data[0]
-    hv_image0 = classifier.encode_image(image0)
+    hv_image0 = classifier.encode_image(image0, dataset_indices(train_data)[0])
     result = classifier.decode_image(hv_image0)
-    image0.save("sample0.png")
+    PIL.Image.fromarray(image0).save("sample0.png")
     result.save("sample0_rec.png")
 
 
-def test_classifier():
-    train_data, test_data, classifier = initialize(2000)
+def test_classifier(N=2000, parallel=False, processes=None, epochs=0, cache=None, early_exit=None, seed=None):
+    train_data, test_data, classifier = initialize(N, cache, seed)
 
     print("======= training classifier =====")
-    classifier.train(train_data)
+    if epochs:
+        classifier.retrain(train_data, epochs)
+    elif parallel:
+        classifier.train_parallel(train_data, processes)
+    else:
+        classifier.train(train_data)
+    # stop comparing class hypervectors once the winner is significant at this confidence
+    classifier.classifier.early_exit = early_exit
 
     print("======= testing classifier =====")
+    if parallel:
+        print("ACCURACY: %f" % classifier.evaluate_parallel(test_data, processes))
+        return
+
     correct, count = 0, 0
-    for image, category in (pbar := tqdm.tqdm(test_data)):
-        cat, dist = classifier.classify(image)
+    for (image, category), index in zip(pbar := progress(test_data), dataset_indices(test_data)):
+        cat, dist = classifier.classify(image, index)
         print(cat, category)
         if cat == category:
             correct += 1
@@ -0,0 +1,77 @@
+"""
+Serve an MNIST model (.hdcm) and / or a CSV table as an HDDatabase over JSON lines,
+batching concurrent requests, see hdc/server.py for the protocol.
+
+    python hdc-serve.py --model mnist_10_10000.hdcm --db digimon.csv --socket /tmp/hdc.sock
+    python hdc-serve.py --db digimon.csv --key Digimon --port 8765 --window 2
+"""
+import argparse
+import asyncio
+import csv
+import pickle
+from hdc import HDC, HDDatabase, HDImageEncoder, HDItemMem
+from hdc.model import load_model, unpack_rows, seeded_codebook
+from hdc.server import HDServer, database_handlers, classifier_handlers
+
+IMAGE_SIZE = 28 # MNIST image size
+
+
+def load_classifier(path):
+    # HDImageEncoder and class item memory of an hdc-board.py model, at its width
+    header, item_memory, position_table = load_model(path)
+    position_table = seeded_codebook(header) if position_table is None else unpack_rows(position_table, header['dims'])
+    HDC.SIZE, HDC.PACKED = header['dims'], True
+    positions = HDC.pack(position_table)
+    encoder = HDImageEncoder(positions[:IMAGE_SIZE], positions[IMAGE_SIZE:])
+    classes = HDItemMem("classes")
+    classes.add_many(list(range(header['n_classes'])), HDC.pack(unpack_rows(item_memory, header['dims'])))
+    return encoder, classes
+
+def load_database(path, key):
+    # a CSV table, or a database pickled by hdc-compress.py at its reduced width
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        HDC.SIZE, HDC.PACKED = state['size'], state['packed']
+        return state['db']
+    db = HDDatabase()
+    with open(path, "r") as csvf:
+        db.bulk_load((row[key], row) for row in csv.DictReader(csvf))
+    return db
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help="serve classify with this .hdcm model")
+    parser.add_argument('--db', help="serve get_value / get_matches / get_analogy on this CSV or .pkl")
+    parser.add_argument('--key', default='Digimon', help="primary key column of the CSV")
+    parser.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=2.0, help="batching window in ms")
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-pending', type=int, default=4096, help="queued requests per operation")
+    parser.add_argument('--timeout', type=float, default=5.0, help="per-request timeout in seconds")
+    parser.add_argument('--workers', type=int, help="threads running the batches")
+    args = parser.parse_args(argv)
+    if not args.model and not args.db:
+        parser.error("nothing to serve, pass --model and / or --db")
+
+    handlers = {}
+    if args.model:
+        handlers.update(classifier_handlers(*load_classifier(args.model)))
+    if args.db:
+        # the table is encoded at the model width when both are served
+        if not args.model:
+            HDC.SIZE, HDC.PACKED = 10000, True
+        size = HDC.SIZE
+        handlers.update(database_handlers(load_database(args.db, args.key)))
+        if args.model and HDC.SIZE != size:
+            parser.error("the database has %d dimensions, the model %d" % (HDC.SIZE, size))
+
+    server = HDServer(handlers, args.window / 1000, args.max_batch, args.max_pending, args.timeout,
+                      workers=args.workers)
+    print("serving %s on %s" % (", ".join(sorted(handlers)), args.socket or "%s:%d" % (args.host, args.port)))
+    asyncio.run(server.serve_forever(args.socket, args.host, args.port))
+
+if __name__ == '__main__':
+    main()
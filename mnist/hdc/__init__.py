@@ -0,0 +1,29 @@
+"""
+Hyperdimensional computing on binary hypervectors. Importing the package needs only
+numpy; tqdm, matplotlib and torchvision are imported by the few functions that use them.
+
+    core       HDC primitives and HDAccumulator
+    memory     item memories, codebooks and the LSH cleanup index
+    encoders   image and text encoders
+    cache      on-disk encoding cache
+    database   HDDatabase
+    studies    Monte-Carlo distance studies
+    instrument opt-in timing of the hot paths (not re-exported)
+    server     asyncio micro-batching query server (not re-exported)
+    compress   dimension reduction of trained models (not re-exported)
+    model      the .hdcm model container (not re-exported)
+    data       memory-mapped MNIST loading (not re-exported)
+"""
+from .core import WORD_BITS, HDC, HDAccumulator
+from .memory import HDItemMem, HDBitSampleIndex, HDCodebook
+from .encoders import HDImageEncoder, HDTextEncoder, make_letter_hvs, make_word, make_words
+from .cache import HDEncodingCache, dataset_indices, dataset_batches, dataset_identity
+from .database import HDDatabase
+from .studies import (HDDistanceStats, word_distance_trials, monte_carlo, monte_carlo_batched,
+                      plot_dist_distributions, study_distributions)
+
+__all__ = ['WORD_BITS', 'HDC', 'HDAccumulator', 'HDItemMem', 'HDBitSampleIndex', 'HDCodebook',
+           'HDImageEncoder', 'HDTextEncoder', 'make_letter_hvs', 'make_word', 'make_words',
+           'HDEncodingCache', 'dataset_indices', 'dataset_batches', 'dataset_identity', 'HDDatabase',
+           'HDDistanceStats', 'word_distance_trials', 'monte_carlo', 'monte_carlo_batched',
+           'plot_dist_distributions', 'study_distributions']
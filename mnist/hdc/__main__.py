@@ -0,0 +1,17 @@
+# python -m hdc: distances of a few words, then the distribution study
+from . import HDC, make_letter_hvs, make_word, study_distributions
+
+HDC.SIZE = 10000
+HDC.PACKED = True
+
+letter_cb = make_letter_hvs()
+hv1 = make_word(letter_cb,"fox")
+hv2 = make_word(letter_cb,"box")
+hv3 = make_word(letter_cb,"xfo")
+hv4 = make_word(letter_cb,"care")
+
+print(HDC.dist(hv1, hv2))
+print(HDC.dist(hv1, hv3))
+print(HDC.dist(hv1, hv4))
+
+study_distributions()
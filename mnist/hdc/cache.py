@@ -0,0 +1,163 @@
+"""
+On-disk cache of dataset encodings.
+"""
+import os
+import hashlib
+import numpy as np
+from .core import HDC
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks (Windows): share a cache directory between processes at your own risk
+    fcntl = None
+
+class HDEncodingCache:
+    # Memory-mapped on-disk store of encodings, keyed by a fingerprint of the codebook they
+    # were made with and the dataset index of the input: row <index> of <fingerprint>.hv.
+    # Rows are kept bit packed whatever HDC.PACKED is. Whole fingerprints are evicted,
+    # least recently used first, to keep the directory under max_bytes. The files are only
+    # ever grown, under an exclusive lock on <fingerprint>.lock, so pool workers sharing a
+    # cache never shrink a file another worker has mapped.
+
+    def __init__(self, fingerprint, path='encodings', max_bytes=1 << 30):
+        self.fingerprint = fingerprint
+        self.path = path
+        self.max_bytes = max_bytes
+        self.words = HDC.words()
+        os.makedirs(path, exist_ok=True)
+        self._open()
+        self._evict()
+
+    @classmethod
+    def fingerprint_of(cls, *arrays, source=None):
+        # the codebook arrays and the identity of the inputs (see dataset_identity): the
+        # same index of another file, or of the same file binarized differently, is
+        # another input
+        h = hashlib.sha1(str(HDC.SIZE).encode())
+        h.update(str(source).encode())
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            h.update(str(a.shape).encode())
+            h.update(a.tobytes())
+        return h.hexdigest()[:16]
+
+    def __getstate__(self):
+        # pool workers reopen the maps instead of receiving a copy of them
+        state = self.__dict__.copy()
+        del state['hvs'], state['valid']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _file(self, ext):
+        return os.path.join(self.path, self.fingerprint + ext)
+
+    def _open(self, rows=0):
+        # map the files, growing (never shrinking) them to at least <rows> rows
+        row_bytes = self.words * 8
+        rows = min(rows, self.max_bytes // (row_bytes + 1))
+        with open(self._file('.lock'), 'ab') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            for ext, width in (('.hv', row_bytes), ('.ok', 1)):
+                with open(self._file(ext), 'ab') as f:
+                    if os.fstat(f.fileno()).st_size < rows * width:
+                        f.truncate(rows * width)
+                os.utime(self._file(ext))
+        n = min(os.path.getsize(self._file('.hv')) // row_bytes, os.path.getsize(self._file('.ok')))
+        if n == 0:
+            self.hvs = np.zeros((0, self.words), dtype=np.uint64)
+            self.valid = np.zeros(0, dtype=np.uint8)
+            return
+        self.hvs = np.memmap(self._file('.hv'), dtype=np.uint64, mode='r+', shape=(n, self.words))
+        self.valid = np.memmap(self._file('.ok'), dtype=np.uint8, mode='r+', shape=(n,))
+
+    def reserve(self, rows):
+        # grow the files to <rows> rows up front, e.g. in the parent before starting workers
+        if rows > len(self.valid):
+            self._open(rows)
+
+    def _evict(self):
+        # other processes may evict the same files concurrently, so any of them can vanish
+        files = {}
+        for name in os.listdir(self.path):
+            fingerprint, ext = os.path.splitext(name)
+            if ext in ('.hv', '.ok'):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                size, used = files.get(fingerprint, (0, 0))
+                files[fingerprint] = (size + st.st_size, max(used, st.st_mtime))
+        total = sum(size for size, _ in files.values())
+        for fingerprint, (size, _) in sorted(files.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            if fingerprint == self.fingerprint:
+                continue
+            for ext in ('.hv', '.ok', '.lock'):
+                try:
+                    os.remove(os.path.join(self.path, fingerprint + ext))
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def lookup(self, indices):
+        # (hit mask, encodings of the hits in the current HDC layout)
+        indices = np.asarray(indices)
+        hit = indices < len(self.valid)
+        hit[hit] = self.valid[indices[hit]] == 1
+        hvs = np.asarray(self.hvs[indices[hit]])
+        return hit, (hvs if HDC.PACKED else HDC.unpack(hvs).astype(np.int64))
+
+    def store(self, indices, hvs):
+        indices = np.asarray(indices)
+        if len(indices) and indices.max() >= len(self.valid):
+            self._open(indices.max() + 1)
+            self._evict()
+        keep = indices < len(self.valid)
+        hvs = np.asarray(hvs) if HDC.PACKED else HDC.pack(hvs)
+        self.hvs[indices[keep]] = hvs[keep]
+        self.valid[indices[keep]] = 1
+
+    def encode(self, indices, inputs, encode_fn):
+        # encodings of inputs, calling encode_fn only on the ones not cached yet
+        hit, cached = self.lookup(indices)
+        if hit.all():
+            return cached
+        missing = np.flatnonzero(~hit)
+        fresh = encode_fn([inputs[i] for i in missing])
+        self.store(np.asarray(indices)[missing], fresh)
+        res = np.empty((len(hit),) + fresh.shape[1:], dtype=fresh.dtype)
+        res[hit] = cached
+        res[missing] = fresh
+        return res
+
+
+def dataset_identity(data):
+    # which file and preprocessing the dataset indices refer to, None when unknown
+    return getattr(data, 'identity', None)
+
+def dataset_indices(data):
+    # stable dataset index of every item: the base indices of a torch Subset, else positions
+    return list(getattr(data, 'indices', range(len(data))))
+
+def dataset_batches(data, size=256):
+    # (images (n, H, W), labels (n,), dataset indices) chunks of a dataset of (image, label)
+    # pairs, gathered a chunk at a time by datasets with a batches method (MNISTData)
+    if hasattr(data, 'batches'):
+        yield from data.batches(size)
+        return
+    images, labels, indices = [], [], []
+    for (image, label), index in zip(data, dataset_indices(data)):
+        images.append(np.asarray(image))
+        labels.append(label)
+        indices.append(index)
+        if len(images) == size:
+            yield np.stack(images), np.array(labels), indices
+            images, labels, indices = [], [], []
+    if images:
+        yield np.stack(images), np.array(labels), indices
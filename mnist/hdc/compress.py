@@ -0,0 +1,106 @@
+"""
+Shrinking trained models to fewer dimensions. Dimensions are scored on encoded training
+data and kept a whole packed word (64 dimensions) at a time. Class prototypes are
+per-dimension majorities, so the prototypes of a column subset are the column subset of
+the prototypes and the accuracy at every candidate width comes from slicing cached
+encodings, without encoding anything again.
+
+The image encoder permutes by a roll, which mixes neighbouring dimensions: an encoder
+run on the kept columns of the codebook differs from the kept columns of the full
+encoding in the first dimension of every kept block. Reduced image models are therefore
+retrained at the reduced width. HDDatabase encodings never permute, so cutting every
+hypervector to its first <size> dimensions gives exactly the database built at that
+width, and keyed codebooks stay regenerable since keyed_vecs of a smaller size is a
+prefix of the larger one.
+"""
+import contextlib
+import copy
+import numpy as np
+from .core import HDC, WORD_BITS
+
+
+@contextlib.contextmanager
+def width(size):
+    # run HDC at <size> dimensions for the duration of the block
+    prev, HDC.SIZE = HDC.SIZE, size
+    try:
+        yield
+    finally:
+        HDC.SIZE = prev
+
+def class_bit_counts(hvs, labels, classes, chunk=4096):
+    # per-class set-bit counts (classes x SIZE) and class sizes of a stack of encodings
+    counts = np.zeros((classes, HDC.SIZE), dtype=np.int64)
+    labels = np.asarray(labels)
+    for i in range(0, len(hvs), chunk):
+        bits = HDC.unpack(hvs[i:i + chunk]) if HDC.PACKED else hvs[i:i + chunk]
+        for c in np.unique(labels[i:i + chunk]):
+            counts[c] += np.sum(bits[labels[i:i + chunk] == c], axis=0, dtype=np.int64)
+    return counts, np.bincount(labels, minlength=classes)
+
+def dimension_scores(counts, totals):
+    # Fisher ratio of every dimension: the variance of the per-class bit rates over the
+    # mean within-class variance of the bits
+    weights = totals / max(1, totals.sum())
+    rates = counts / np.maximum(totals, 1)[:, None]
+    mean = weights @ rates
+    between = weights @ (rates - mean) ** 2
+    within = weights @ (rates * (1 - rates))
+    return between / (within + 1e-9)
+
+def word_order(scores, prefix=False):
+    # indices of the whole words, the best first. A trailing partial word is never kept.
+    words = len(scores) // WORD_BITS
+    if prefix:
+        return np.arange(words)
+    per_word = scores[:words * WORD_BITS].reshape(words, WORD_BITS).sum(axis=1)
+    return np.argsort(-per_word, kind='stable')
+
+def word_dims(words):
+    # the dimensions of a set of words, in increasing order
+    words = np.sort(words)
+    return (words[:, None] * WORD_BITS + np.arange(WORD_BITS)).ravel()
+
+def columns(hvs, words):
+    # the given words of packed encodings, or their dimensions of unpacked ones
+    return hvs[:, np.sort(words)] if HDC.PACKED else hvs[:, word_dims(words)]
+
+def sweep(prototypes, hvs, labels, order, widths):
+    # accuracy of nearest-prototype classification on the first <w> dimensions of the
+    # ranking, for every width w (a multiple of 64)
+    res = []
+    for w in widths:
+        words = order[:w // WORD_BITS]
+        dists = HDC.hamming_matrix(columns(hvs, words), columns(prototypes, words))
+        res.append(dict(dims=w, accuracy=float(np.mean(np.argmin(dists, axis=1) == labels)),
+                        model_bytes=len(prototypes) * w // 8))
+    return res
+
+def pick_width(results, tolerance):
+    # the smallest width within <tolerance> of the best accuracy of the sweep
+    best = max(r['accuracy'] for r in results)
+    return min(r['dims'] for r in results if r['accuracy'] >= best - tolerance)
+
+def truncate(item_mem, size):
+    # cut every hypervector of an item memory to its first <size> dimensions, in place.
+    # An empty item memory has nothing to cut and takes the width of its first add.
+    if item_mem.matrix is None:
+        return item_mem
+    hvs = item_mem.vectors()
+    if HDC.PACKED:
+        hvs = hvs[:, :-(-size // WORD_BITS)].copy()
+        if size % WORD_BITS:
+            hvs[:, -1] &= np.uint64((1 << (size % WORD_BITS)) - 1)
+    else:
+        hvs = hvs[:, :size].copy()
+    item_mem.matrix = hvs
+    item_mem.accumulators = {}
+    item_mem.version += 1
+    return item_mem
+
+def truncate_database(db, size):
+    # copy of an HDDatabase holding the first <size> dimensions; query it under width(size)
+    res = copy.deepcopy(db)
+    for item_mem in [res.db, res.codebook, res.field_names] + list(res.field_codebooks.values()):
+        truncate(item_mem, size)
+    return res
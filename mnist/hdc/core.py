@@ -0,0 +1,281 @@
+"""
+Hypervector primitives. Binary hypervectors of HDC.SIZE bits are stored one int per bit,
+or with HDC.PACKED bit-packed into uint64 words; every operation works on a single
+vector or on a stack of them along the leading axes.
+"""
+import hashlib
+import numpy as np
+from .instrument import timed
+
+WORD_BITS = 64
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(x):
+        # per-byte lookup, folded back into one count per word
+        x = np.ascontiguousarray(x)
+        return _POPCOUNT_TABLE[x.view(np.uint8)].reshape(x.shape + (-1,)).sum(axis=-1)
+
+
+class HDC:
+    SIZE = 10000
+    # store hypervectors as bits packed into uint64 words instead of one int per bit
+    PACKED = False
+    # every random draw comes from rng; HDC.seed(n) makes a run reproducible
+    SEED = None
+    rng = np.random.default_rng()
+
+    @classmethod
+    def seed(cls,seed=None):
+        HDC.SEED = seed
+        HDC.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def words(cls):
+        return -(-HDC.SIZE // WORD_BITS)
+
+    @classmethod
+    def pack(cls,bits):
+        # (..., SIZE) array of 0/1 -> (..., words) uint64, bit k lives in word k // 64 at position k % 64
+        bits = np.asarray(bits)
+        pad = cls.words() * WORD_BITS - bits.shape[-1]
+        if pad:
+            bits = np.concatenate([bits, np.zeros(bits.shape[:-1] + (pad,), dtype=bits.dtype)], axis=-1)
+        packed = np.packbits(bits.astype(np.uint8), axis=-1, bitorder='little')
+        return np.ascontiguousarray(packed).view('<u8').astype(np.uint64, copy=False)
+
+    @classmethod
+    def unpack(cls,x):
+        # inverse of pack, returns (..., SIZE) uint8 bits
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        bits = np.unpackbits(x.view(np.uint8), axis=-1, bitorder='little')
+        return bits[..., :HDC.SIZE]
+
+    @classmethod
+    def clear_padding(cls,x):
+        # zero the unused bits above SIZE in the last word, in place
+        tail = HDC.SIZE % WORD_BITS
+        if tail:
+            x[..., -1] &= np.uint64((1 << tail) - 1)
+        return x
+
+    @classmethod
+    def rand_vec(cls,n=None):
+        # Binary vectors, or an n x SIZE stack of them
+        if HDC.PACKED:
+            # random words directly, never materializing one int per bit
+            shape = (HDC.words(),) if n is None else (n, HDC.words())
+            words = np.frombuffer(HDC.rng.bytes(8 * int(np.prod(shape))), dtype='<u8').reshape(shape)
+            return HDC.clear_padding(words.astype(np.uint64))
+        return HDC.rng.integers(2, size=HDC.SIZE if n is None else (n, HDC.SIZE))
+        # raise Exception("generate atomic hypervector with size HDC.SIZE") 
+
+    @classmethod
+    def keyed_vecs(cls,keys,seed,size=None,packed=None):
+        # one hypervector per key that depends on nothing but (seed, key): each key keys
+        # a counter-based Philox stream with the blake2b digest of "<seed>:<key>", and
+        # bit k is bit k % 8 of byte k // 8 of that stream. Any process, or a later run,
+        # regenerates the same vectors, and a longer vector extends a shorter one.
+        size = HDC.SIZE if size is None else size
+        packed = HDC.PACKED if packed is None else packed
+        n = -(-size // WORD_BITS)
+        words = np.empty((len(keys), n), dtype=np.uint64)
+        for r, key in enumerate(keys):
+            digest = hashlib.blake2b(("%d:%s" % (seed, key)).encode(), digest_size=16).digest()
+            stream = np.random.Generator(np.random.Philox(key=int.from_bytes(digest, 'little')))
+            words[r] = np.frombuffer(stream.bytes(8 * n), dtype='<u8')
+        if size % WORD_BITS:
+            words[:, -1] &= np.uint64((1 << size % WORD_BITS) - 1)
+        if packed:
+            return words
+        return np.unpackbits(words.view(np.uint8), axis=-1, bitorder='little')[:, :size].astype(np.int64)
+    
+    @classmethod
+    @timed()
+    def dist(cls,x1,x2):
+        # How many bits are different: 1/N sum XOR(x1,x2)
+        if HDC.PACKED:
+            return np.divide(np.sum(_popcount(np.bitwise_xor(x1, x2)), axis=-1), HDC.SIZE)
+        return np.divide(np.sum(np.bitwise_xor(x1, x2), axis=-1), HDC.SIZE)
+        # raise Exception("hamming distance between hypervectors") 
+    
+    @classmethod
+    @timed(scan=lambda cls, xs, ys: len(np.atleast_2d(xs)) * len(np.atleast_2d(ys)))
+    def dist_matrix(cls,xs,ys):
+        # pairwise distances between the rows of xs (Q x .) and ys (N x .) -> Q x N
+        return np.divide(HDC.hamming_matrix(xs, ys), HDC.SIZE)
+
+    @classmethod
+    def hamming_matrix(cls,xs,ys):
+        # pairwise counts of differing bits, also valid on slices of the dimensions
+        xs, ys = np.atleast_2d(xs), np.atleast_2d(ys)
+        if HDC.PACKED:
+            res = np.empty((len(xs), len(ys)), dtype=np.int64)
+            step = max(1, (1 << 22) // max(1, ys.size))
+            for i in range(0, len(xs), step):
+                diff = np.bitwise_xor(xs[i:i + step, None, :], ys[None, :, :])
+                res[i:i + step] = np.sum(_popcount(diff), axis=-1)
+        else:
+            # |x xor y| = |x| + |y| - 2 x.y, float32 is exact below 2**24 bits
+            fx, fy = xs.astype(np.float32), ys.astype(np.float32)
+            res = fx.sum(axis=1)[:, None] + fy.sum(axis=1)[None, :] - 2 * (fx @ fy.T)
+            res = np.rint(res).astype(np.int64)
+        return res
+
+    @classmethod
+    @timed()
+    def bind(cls,x1,x2):
+        # XOR
+        return np.bitwise_xor(x1, x2)
+        # raise Exception("bind two hypervectors together") 
+
+    @classmethod
+    def bind_all(cls, xs):
+        # XOR for array
+        return np.bitwise_xor.reduce(xs)
+        # raise Exception("convenience function. bind together a list of hypervectors") 
+
+    @classmethod
+    def bit_counts(cls,xs):
+        # per-dimension number of set bits over a stack of hypervectors
+        if HDC.PACKED:
+            return np.sum(HDC.unpack(np.asarray(xs)), axis=0, dtype=np.int64)
+        return np.sum(xs, axis=0, dtype=np.int64)
+
+    @classmethod
+    def threshold(cls,counts,n):
+        # Majority vote on the bit counts of n hypervectors
+        bits = counts >= (n / 2)
+        return HDC.pack(bits) if HDC.PACKED else 1 * bits
+
+    @classmethod
+    @timed()
+    def bundle(cls,xs):
+        # Majority vote: (x1+x2) > (K/2)
+        return HDC.threshold(HDC.bit_counts(xs), len(xs))
+        # raise Exception("bundle together xs, a list of hypervectors") 
+          
+
+    @classmethod
+    @timed()
+    def permute(cls,x,i):
+        # Bit shifting
+        if HDC.PACKED:
+            return _rotate(x, i)
+        return np.roll(x, i, axis=-1)
+        # raise Exception("permute x by i, where i can be positive or negative") 
+    
+    
+    # below this flip probability apply_bit_flips draws the flipped positions instead
+    # of one random number per bit
+    SPARSE_FLIPS = 0.05
+    # random numbers drawn per step, bounding the scratch memory of apply_bit_flips
+    FLIP_CHUNK = 1 << 18
+
+    @classmethod
+    def apply_bit_flips(cls,x,p=0.0):
+        # flip every bit of x, one vector or a whole stack, independently with probability p
+        x = np.array(x, copy=True)
+        if p <= 0:
+            return x
+        rows = x.reshape(-1, x.shape[-1])
+        if p >= HDC.SPARSE_FLIPS:
+            # one uniform draw per bit, a block of rows at a time
+            step = max(1, HDC.FLIP_CHUNK // HDC.SIZE)
+            for i in range(0, len(rows), step):
+                loc = HDC.rng.random((len(rows[i:i + step]), HDC.SIZE)) < p
+                rows[i:i + step] ^= HDC.pack(loc) if HDC.PACKED else loc.astype(rows.dtype)
+            return x
+        # the gaps between flipped bits of the flattened stack are geometric
+        total, last = len(rows) * HDC.SIZE, -1
+        flat = rows.reshape(-1)
+        while last < total:
+            n = min(HDC.FLIP_CHUNK, int((total - last) * p * 1.1) + 16)
+            flips = last + np.cumsum(HDC.rng.geometric(p, size=n))
+            last = flips[-1]
+            flips = flips[flips < total]
+            if HDC.PACKED:
+                # flips are sorted, so the flips of one word are a run to OR together
+                row, bit = np.divmod(flips, HDC.SIZE)
+                words = row * HDC.words() + bit // WORD_BITS
+                first = np.flatnonzero(np.diff(words, prepend=-1))
+                masks = np.left_shift(np.uint64(1), (bit % WORD_BITS).astype(np.uint64))
+                flat[words[first]] ^= np.bitwise_or.reduceat(masks, first) if len(first) else masks
+            else:
+                flat[flips] ^= 1
+        return x
+        # raise Exception("return a corrupted hypervector, given a per-bit bit flip probability p") 
+
+
+def _shift_up(x, s):
+    # move every bit of a packed vector s positions towards higher indices
+    q, r = divmod(s, WORD_BITS)
+    out = np.zeros_like(x)
+    n = x.shape[-1]
+    if q >= n:
+        return out
+    out[..., q:] = x[..., :n - q] << np.uint64(r)
+    if r:
+        out[..., q + 1:] |= x[..., :n - q - 1] >> np.uint64(WORD_BITS - r)
+    return out
+
+def _shift_down(x, s):
+    # move every bit of a packed vector s positions towards lower indices
+    q, r = divmod(s, WORD_BITS)
+    out = np.zeros_like(x)
+    n = x.shape[-1]
+    if q >= n:
+        return out
+    out[..., :n - q] = x[..., q:] >> np.uint64(r)
+    if r:
+        out[..., :n - q - 1] |= x[..., q + 1:] << np.uint64(WORD_BITS - r)
+    return out
+
+def _rotate(x, i):
+    # np.roll over the SIZE logical bits, carried across word boundaries.
+    # padding bits above SIZE are kept at zero so they never rotate in.
+    x = np.asarray(x, dtype=np.uint64)
+    s = i % HDC.SIZE
+    if s == 0:
+        return x.copy()
+    return HDC.clear_padding(_shift_up(x, s) | _shift_down(x, HDC.SIZE - s))
+    
+
+
+class HDAccumulator:
+    # Streaming bundle: per-dimension set-bit counts of every hypervector added so far.
+    # finalize() is the same majority vote HDC.bundle takes over those hypervectors,
+    # without having to keep them around.
+
+    def __init__(self):
+        self.counts = np.zeros(HDC.SIZE, dtype=np.int64)
+        self.n = 0
+
+    def add(self,hvs,weight=1):
+        # a single hypervector or a stack of them, weight is one for all or one per row
+        hvs = np.asarray(hvs)
+        if hvs.ndim == 1:
+            hvs = hvs[None, :]
+        if np.ndim(weight):
+            # weighted sum of the rows as float64 matrix products, exact below 2**53
+            weight = np.asarray(weight, dtype=np.float64)
+            for i in range(0, len(hvs), 1024):
+                bits = HDC.unpack(hvs[i:i + 1024]) if HDC.PACKED else hvs[i:i + 1024]
+                self.counts += np.rint(weight[i:i + 1024] @ bits.astype(np.float64)).astype(np.int64)
+            self.n += int(weight.sum())
+            return
+        self.counts += weight * HDC.bit_counts(hvs)
+        self.n += weight * len(hvs)
+
+    def subtract(self,hvs):
+        self.add(hvs, weight=-1)
+
+    def merge(self,other):
+        self.counts += other.counts
+        self.n += other.n
+
+    def finalize(self):
+        return HDC.threshold(self.counts, self.n)
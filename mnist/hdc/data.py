@@ -0,0 +1,109 @@
+"""
+MNIST without torch or PIL: the raw IDX files (or .npy copies of them) are memory-mapped
+and images are binarized only when a chunk of them is read, so opening the full 60k set
+costs nothing and iterating it uses constant memory.
+
+    train, test = split(load_mnist('data', N=1000), [0.6, 0.4], seed=0)
+    for images, labels, indices in train.batches(256):   # (n, 28, 28) 0 / 255 arrays
+        ...
+
+load_mnist finds the files torchvision downloads (data/MNIST/raw/train-images-idx3-ubyte
+and friends) or files placed directly under the root. Only when they are missing, and
+download is set, torchvision is imported to fetch them.
+"""
+import os
+import numpy as np
+
+FILES = {True: ('train-images-idx3-ubyte', 'train-labels-idx1-ubyte'),
+         False: ('t10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte')}
+
+
+def read_idx(path):
+    # IDX file (the raw MNIST format) as a read-only memmap, no copy
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if magic[:2] != b'\0\0' or magic[2] != 0x08:
+            raise ValueError("%s: not an unsigned byte IDX file" % path)
+        shape = tuple(np.frombuffer(f.read(4 * magic[3]), dtype='>i4'))
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=4 + 4 * len(shape), shape=shape)
+
+def read_inputs(path):
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return read_idx(path)
+
+
+def file_identity(path):
+    # changes whenever the file is replaced or rewritten
+    st = os.stat(path)
+    return "%s:%d:%d" % (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+class MNISTData:
+    # A view of (image, label) pairs over memory-mapped arrays. indices are the rows of
+    # the underlying files this view covers; they are also the stable dataset indices
+    # used as encoding cache keys (see dataset_indices). Items and batches are
+    # binarized to 0 / 255 at <threshold> as they are read. source identifies the image
+    # file; together with the threshold it is the identity of the encoded inputs (see
+    # dataset_identity), which the encoding cache is keyed on.
+
+    def __init__(self, images, labels, indices=None, threshold=128, source=None):
+        self.images = images
+        self.labels = labels
+        self.indices = np.arange(len(images)) if indices is None else np.asarray(indices)
+        self.threshold = threshold
+        self.source = source
+        self.identity = None if source is None else "%s threshold=%d" % (source, threshold)
+
+    def subset(self, indices):
+        return MNISTData(self.images, self.labels, self.indices[indices], self.threshold, self.source)
+
+    def binarize(self, raw):
+        return np.where(raw >= self.threshold, 255, 0).astype(np.uint8)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        row = self.indices[i]
+        return self.binarize(self.images[row]), int(self.labels[row])
+
+    def __iter__(self):
+        for images, labels, _ in self.batches():
+            yield from zip(images, labels.tolist())
+
+    def batches(self, size=256):
+        # (images (n, 28, 28), labels (n,), dataset indices) chunks, one gather each
+        for start in range(0, len(self.indices), size):
+            rows = self.indices[start:start + size]
+            yield self.binarize(self.images[rows]), np.asarray(self.labels[rows], dtype=np.int64), rows.tolist()
+
+
+def find_files(root, train):
+    for directory in (os.path.join(root, 'MNIST', 'raw'), root):
+        for ext in ('', '.npy'):
+            paths = [os.path.join(directory, name + ext) for name in FILES[train]]
+            if all(os.path.exists(p) for p in paths):
+                return paths
+    return None
+
+def load_mnist(root='data', train=True, N=None, threshold=128, download=True):
+    # the first N images of the train or test set
+    paths = find_files(root, train)
+    if paths is None and download:
+        from torchvision.datasets import MNIST
+        MNIST(root=root, train=train, download=True)
+        paths = find_files(root, train)
+    if paths is None:
+        raise FileNotFoundError("no MNIST %s files under %s" % ("train" if train else "test", root))
+    images, labels = (read_inputs(p) for p in paths)
+    data = MNISTData(images, labels, threshold=threshold, source=file_identity(paths[0]))
+    return data if N is None else data.subset(slice(0, N))
+
+def split(data, fractions, seed=None):
+    # random disjoint subsets with the given fractions of the data. every subset keeps its
+    # indices sorted, so reading it walks the files forward
+    order = np.random.default_rng(seed).permutation(len(data))
+    ends = np.rint(np.cumsum(fractions) / np.sum(fractions) * len(data)).astype(np.int64)
+    starts = np.concatenate([[0], ends[:-1]])
+    return [data.subset(np.sort(order[s:e])) for s, e in zip(starts, ends)]
@@ -0,0 +1,218 @@
+"""
+A key-value table stored as hypervectors: every row is the bundle of its bound
+field / value pairs, with a per-field codebook to clean up decoded values.
+"""
+import itertools
+import numpy as np
+from .core import HDC
+from .memory import HDItemMem, HDCodebook
+from .instrument import timed
+
+class HDDatabase:
+
+    def __init__(self):
+        self.db = HDItemMem("db")
+        self.codebook = HDCodebook("string")
+        # columnar copy of the table: values[r, f] is the codebook row of the value of
+        # field fields[f] in db row r, or -1 when the row has no such field
+        self.fields = []
+        self.values = np.zeros((0, 0), dtype=np.int64)
+        # the schema learned from the data: an item memory of the field names, and per
+        # field an item memory of just the values seen in that field
+        self.field_names = HDItemMem("fields")
+        self.field_codebooks = {}
+        # confidence of the early-exit cleanup of decoded values, None scans every bit
+        self.early_exit = None
+        # raise Exception("other instantiations here")
+        
+    def encode_string(self,value):
+        if self.codebook.has(value):
+            return self.codebook.get(value)
+        else:
+            return self.codebook.add(value)
+        # raise Exception("translate a string to a hypervector") 
+        
+    def intern(self,strings):
+        # codebook rows of strings, adding all unseen ones in one batch
+        new = [s for s in dict.fromkeys(strings) if not self.codebook.has(s)]
+        if new:
+            self.codebook.add_many(new)
+        return np.array([self.codebook.index[s] for s in strings], dtype=np.int64)
+
+    def decode_string(self,hypervec):
+        return self.codebook.wta(hypervec)[0]
+        # raise Exception("translate a hypervector to a string") 
+
+    def bind_fields(self, fields):
+        res = []
+        for k, v in fields.items():
+            hv = HDC.bind(self.encode_string(k), self.encode_string(v))
+            res.append(hv)
+        return res
+
+    def encode_row(self, fields):
+        return HDC.bundle(self.bind_fields(fields))
+        # raise Exception("translate a dictionary of field-value pairs to a hypervector") 
+        
+    def decode_row(self, hypervec):
+        return self.decode_rows(np.asarray(hypervec)[None, :])[0]
+        # raise Exception("reconstruct a dictionary of field-value pairs from a hypervector.") 
+
+    def decode_rows(self, hypervecs, present=None):
+        # unbind every field of every row at once, then one batched wta per field
+        # against only the values that field has taken. present (rows x fields, as
+        # self.values >= 0) limits each row to the fields it holds, all by default.
+        field_hvs = self.codebook.vectors()[self.intern(self.fields)]
+        unbound = HDC.bind(hypervecs[:, None, :], field_hvs[None, :, :])
+        res = [{} for _ in range(len(hypervecs))]
+        for f, field in enumerate(self.fields):
+            rows = np.arange(len(hypervecs)) if present is None else np.flatnonzero(present[:, f])
+            if len(rows) == 0:
+                continue
+            for r, (value, _) in zip(rows, self.field_codebooks[field].wta(unbound[rows, f])):
+                res[r][field] = value
+        return res
+
+    def encode_values(self, values):
+        # row hypervectors of a (rows x fields) matrix of codebook rows, -1 = no value:
+        # gather the values, bind them with the field hypervectors, sum and threshold per row
+        fields = self.intern(self.fields)
+        strings = self.codebook.vectors()
+        field_hvs = strings[fields]
+        chunk = max(1, (1 << 25) // (max(1, len(self.fields)) * HDC.SIZE))
+        res = []
+        for i in range(0, len(values), chunk):
+            idx = values[i:i + chunk]
+            present = idx >= 0
+            bound = HDC.bind(strings[np.where(present, idx, 0)], field_hvs[None, :, :])
+            bits = HDC.unpack(bound) if HDC.PACKED else bound
+            counts = np.sum(bits * present[:, :, None], axis=1, dtype=np.int64)
+            res.append(HDC.threshold(counts, present.sum(axis=1)[:, None]))
+        return np.concatenate(res)
+
+    @timed()
+    def bulk_load(self, rows, block=4096):
+        # (primary key, {field: value}) pairs, loaded <block> rows at a time. all strings of a
+        # block are interned at once and its rows encoded as one batched gather-xor-sum.
+        # rows of existing keys are updated field by field.
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, block))
+            if not chunk:
+                break
+            names = [k for k in dict.fromkeys(k for _, fields in chunk for k in fields) if k not in self.fields]
+            self.fields += names
+            self.values = np.pad(self.values, ((0, 0), (0, len(names))), constant_values=-1)
+            column = {k: i for i, k in enumerate(self.fields)}
+
+            keys = list(dict.fromkeys(key for key, _ in chunk))
+            slot = {key: i for i, key in enumerate(keys)}
+            values = np.full((len(keys), len(self.fields)), -1, dtype=np.int64)
+            existing = [i for i, key in enumerate(keys) if self.db.has(key)]
+            values[existing] = self.values[[self.db.index[keys[i]] for i in existing]]
+
+            cells = [(slot[key], column[k], v) for key, fields in chunk for k, v in fields.items()]
+            if cells:
+                r, c, v = zip(*cells)
+                values[list(r), list(c)] = self.intern(v)
+
+            self.db.add_many(keys, self.encode_values(values))
+            self.update_schema(values)
+            self.values = np.pad(self.values, ((0, len(self.db.keys) - len(self.values)), (0, 0)), constant_values=-1)
+            self.values[[self.db.index[key] for key in keys]] = values
+
+    def update_schema(self, values):
+        # register the field names and every field's new values in their item memories
+        strings = self.codebook.vectors()
+        names = [name for name in self.fields if not self.field_names.has(name)]
+        if names:
+            self.field_names.add_many(names, strings[self.intern(names)])
+        for f, field in enumerate(self.fields):
+            if field not in self.field_codebooks:
+                self.field_codebooks[field] = HDItemMem(field)
+                self.field_codebooks[field].early_exit = self.early_exit
+            codebook = self.field_codebooks[field]
+            rows = [r for r in np.unique(values[:, f]) if r >= 0 and not codebook.has(self.codebook.keys[r])]
+            if rows:
+                codebook.add_many([self.codebook.keys[r] for r in rows], strings[rows])
+
+    def set_early_exit(self, confidence):
+        # route every value cleanup through HDItemMem.wta_progressive
+        self.early_exit = confidence
+        for item_mem in [self.codebook, self.field_names] + list(self.field_codebooks.values()):
+            item_mem.early_exit = confidence
+
+    def add_row(self, primary_key, fields):
+        # adding to an existing key sets the given fields and re-encodes its row
+        self.bulk_load([(primary_key, fields)])
+
+    def remove_fields(self, primary_key, fields):
+        row = self.db.index[primary_key]
+        self.values[row, [self.fields.index(k) for k in fields]] = -1
+        self.db.add(primary_key, self.encode_values(self.values[row:row + 1])[0])
+
+    def get_row(self,key):
+        return self.get_rows([key])[0]
+        # raise Exception("retrieve a dictonary of field-value pairs from a hypervector row")
+
+    @timed()
+    def get_rows(self,keys):
+        rows = [self.db.index[key] for key in keys]
+        return self.decode_rows(self.db.vectors()[rows], self.values[rows] >= 0)
+
+    @timed()
+    def get_value(self,key, field, ret_dist=False):
+        hv = self.db.get(key)
+        field_hv = self.encode_string(field)
+        codebook = self.field_codebooks.get(field, self.codebook)
+        return codebook.wta(HDC.bind(field_hv, hv))[0]
+        # raise Exception("given a primary key and a field, get the value assigned to the field")
+        
+    @timed()
+    def get_matches(self, field_value_dict, threshold=0.4):
+        query = self.encode_row(field_value_dict)
+        return self.db.matches(query, threshold=threshold)
+        # raise Exception("get database entries that contain provided dictionary of field-value pairs")
+        
+    @timed()
+    def get_analogy(self, target_key, other_key, target_value):
+        # the field holding target_value is found among the field names only
+        field = self.field_names.wta(HDC.bind(self.db.get(target_key), self.encode_string(target_value)))[0]
+        return self.field_codebooks[field].wta(HDC.bind(self.db.get(other_key), self.encode_string(field)))
+        # raise Exception("analogy query")
+
+    def cleanup_by_field(self, fields, queries):
+        # (value, dist) of every query, one batched wta per field against that field's values
+        res = [None] * len(fields)
+        order = sorted(range(len(fields)), key=lambda i: fields[i])
+        for field, group in itertools.groupby(order, key=lambda i: fields[i]):
+            group = list(group)
+            codebook = self.field_codebooks.get(field, self.codebook)
+            for i, hit in zip(group, codebook.wta(queries[group])):
+                res[i] = hit
+        return res
+
+    def rows_of(self, keys):
+        return self.db.vectors()[[self.db.index[key] for key in keys]]
+
+    @timed()
+    def get_value_batch(self, pairs):
+        # get_value of many (key, field) pairs
+        keys, fields = zip(*pairs)
+        queries = HDC.bind(self.codebook.vectors()[self.intern(fields)], self.rows_of(keys))
+        return [value for value, _ in self.cleanup_by_field(fields, queries)]
+
+    @timed()
+    def get_matches_batch(self, field_value_dicts, threshold=0.4):
+        # get_matches of many queries with one scan of the table
+        queries = np.stack([self.encode_row(fields) for fields in field_value_dicts])
+        return self.db.matches(queries, threshold=threshold)
+
+    @timed()
+    def get_analogy_batch(self, triples):
+        # get_analogy of many (target_key, other_key, target_value) triples
+        targets, others, values = zip(*triples)
+        unbound = HDC.bind(self.rows_of(targets), self.codebook.vectors()[self.intern(values)])
+        fields = [field for field, _ in self.field_names.wta(unbound)]
+        unbound = HDC.bind(self.rows_of(others), self.codebook.vectors()[self.intern(fields)])
+        return self.cleanup_by_field(fields, unbound)
@@ -0,0 +1,189 @@
+"""
+Encoders of images and strings into hypervectors.
+"""
+import string
+import numpy as np
+from .core import HDC, HDAccumulator
+from .memory import HDCodebook
+from .instrument import timed
+
+class HDImageEncoder:
+    # Encodes an image as the bundle over all pixels of bind(x_i, y_j), permuted by one
+    # for white pixels. The position hypervectors and their permuted versions are built
+    # once, so encoding is one masked select over the position table plus one sum.
+
+    def __init__(self, x_hvs, y_hvs, chunk=256):
+        self.width, self.height = len(x_hvs), len(y_hvs)
+        self.chunk = chunk
+        # row i * height + j holds the position hypervector of pixel (i, j)
+        pos = HDC.bind(np.asarray(x_hvs)[:, None, :], np.asarray(y_hvs)[None, :, :])
+        self.positions = pos.reshape(self.width * self.height, -1)
+        self.positions_perm = HDC.permute(self.positions, 1)
+        bits = HDC.unpack(self.positions) if HDC.PACKED else self.positions
+        bits_perm = HDC.unpack(self.positions_perm) if HDC.PACKED else self.positions_perm
+        # bit counts of an all-black image, and how much each white pixel changes them
+        self.base = np.sum(bits, axis=0, dtype=np.int64)
+        self.delta = bits_perm.astype(np.float32) - bits.astype(np.float32)
+
+    def masks(self, images):
+        # N images (PIL or H x W arrays) -> N x (width * height) white-pixel masks
+        if not isinstance(images, np.ndarray):
+            images = np.stack([np.asarray(image) for image in images])
+        arr = images[:, :self.height, :self.width] > 0
+        return arr.transpose(0, 2, 1).reshape(len(arr), -1)
+
+    @timed()
+    def encode_batch(self, images):
+        masks = self.masks(images).astype(np.float32)
+        out = []
+        for i in range(0, len(masks), self.chunk):
+            counts = self.base + np.rint(masks[i:i + self.chunk] @ self.delta)
+            bits = counts >= (self.width * self.height / 2)
+            out.append(HDC.pack(bits) if HDC.PACKED else 1 * bits)
+        return np.concatenate(out)
+
+    @timed()
+    def encode(self, image):
+        return self.encode_batch([image])[0]
+
+    @timed()
+    def decode_batch(self, hvs):
+        # N hypervectors -> N x height x width images of 0 / 255. A pixel is white when the
+        # hypervector is no closer to its position than to the permuted position. Both have
+        # the same weight, so dist(hv, perm) - dist(hv, pos) = -2 hv . delta / SIZE and
+        # every pixel of every image comes out of one matrix product.
+        hvs = np.atleast_2d(hvs)
+        out = []
+        for i in range(0, len(hvs), self.chunk):
+            bits = HDC.unpack(hvs[i:i + self.chunk]) if HDC.PACKED else hvs[i:i + self.chunk]
+            out.append(bits.astype(np.float32) @ self.delta.T >= 0)
+        white = np.concatenate(out).reshape(len(hvs), self.width, self.height).transpose(0, 2, 1)
+        return np.where(white, 255, 0).astype(np.uint8)
+
+    def decode(self, hv):
+        return self.decode_batch(hv[None])[0]
+
+
+class HDTextEncoder:
+    # Encodes strings the way make_word does, the XOR over positions i of letter i
+    # permuted by i, for whole batches. tables[i, a] holds letter a of the alphabet
+    # permuted by i, and row a = len(alphabet) is all zeros to pad shorter strings, so a
+    # batch costs one gather and XOR per position rather than per character. N-gram
+    # profiles bundle the n-gram at every offset of a text into an HDAccumulator.
+
+    def __init__(self, letters=None, alphabet=string.ascii_lowercase, max_len=16):
+        self.alphabet = alphabet
+        self.letters = make_letter_hvs(alphabet) if letters is None else letters
+        codes = np.array([ord(c) for c in alphabet])
+        self.order = np.argsort(codes)
+        self.sorted_codes = codes[self.order]
+        self.tables = None
+        self._extend(max_len)
+
+    def _extend(self, length):
+        # grow the permuted tables to cover positions below <length>
+        have = 0 if self.tables is None else len(self.tables)
+        if length <= have:
+            return
+        rows = np.stack([self.letters.get(c) for c in self.alphabet])
+        rows = np.concatenate([rows, np.zeros_like(rows[:1])])
+        new = np.stack([HDC.permute(rows, i) for i in range(have, length)])
+        self.tables = new if self.tables is None else np.concatenate([self.tables, new])
+
+    def indices(self, strings, skip_unknown=False):
+        # N strings -> N x (longest) matrix of alphabet indices, padded with len(alphabet).
+        # characters outside the alphabet raise KeyError, or are dropped with skip_unknown
+        text = ''.join(strings)
+        lengths = np.array([len(s) for s in strings], dtype=np.int64)
+        chars = np.fromiter(map(ord, text), dtype=np.int64, count=len(text))
+        pos = np.minimum(np.searchsorted(self.sorted_codes, chars), len(self.sorted_codes) - 1)
+        known = self.sorted_codes[pos] == chars
+        idx = self.order[pos]
+        if not known.all():
+            if not skip_unknown:
+                raise KeyError(text[np.argmin(known)])
+            owner = np.repeat(np.arange(len(strings)), lengths)
+            lengths = np.bincount(owner[known], minlength=len(strings))
+            idx = idx[known]
+        res = np.full((len(strings), lengths.max(initial=0)), len(self.alphabet), dtype=np.int64)
+        starts = np.cumsum(lengths) - lengths
+        res[np.repeat(np.arange(len(strings)), lengths), np.arange(len(idx)) - np.repeat(starts, lengths)] = idx
+        return res
+
+    def _xor_positions(self, idx, length):
+        # rows of idx[:, i : i + length] -> XOR over i of tables[i, idx[., i]]
+        self._extend(length)
+        res = self.tables[0, idx[:, 0]]
+        for i in range(1, length):
+            res = np.bitwise_xor(res, self.tables[i, idx[:, i]])
+        return res
+
+    @timed()
+    def encode_batch(self, strings):
+        idx = self.indices(strings)
+        if idx.shape[1] == 0:
+            idx = np.full((len(strings), 1), len(self.alphabet), dtype=np.int64)
+        return self._xor_positions(idx, idx.shape[1])
+
+    def encode(self, string):
+        return self.encode_batch([string])[0]
+
+    def ngram_ids(self, idx, n):
+        # distinct n-grams of an index sequence as integers (the indices in base
+        # len(alphabet) + 1, first letter lowest) and how often each occurs
+        if len(idx) < n:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        windows = np.lib.stride_tricks.sliding_window_view(idx, n)
+        return np.unique(windows @ (len(self.alphabet) + 1) ** np.arange(n), return_counts=True)
+
+    def ngrams(self, ids, n):
+        # hypervectors of n-gram ids
+        grams = np.asarray(ids)[:, None] // (len(self.alphabet) + 1) ** np.arange(n) % (len(self.alphabet) + 1)
+        return self._xor_positions(grams, n)
+
+    @timed()
+    def profile(self, texts, n=3, acc=None):
+        # bundle of the n-grams of a document given as a stream of text pieces. n-grams
+        # spanning two pieces are kept, characters outside the alphabet are dropped.
+        # only the count of every distinct n-gram is kept while streaming, each one is
+        # encoded once at the end and added with its count.
+        # adds to acc when given, returns the HDAccumulator; finalize() is the profile
+        acc = HDAccumulator() if acc is None else acc
+        ids, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        carry = np.zeros(0, dtype=np.int64)
+        for text in texts:
+            idx = np.concatenate([carry, self.indices([text], skip_unknown=True)[0]])
+            new_ids, new_counts = self.ngram_ids(idx, n)
+            ids, inverse = np.unique(np.concatenate([ids, new_ids]), return_inverse=True)
+            counts = np.bincount(inverse, np.concatenate([counts, new_counts]), len(ids)).astype(np.int64)
+            carry = idx[max(0, len(idx) - n + 1):]
+        if len(ids):
+            acc.add(self.ngrams(ids, n), weight=counts)
+        return acc
+
+    def profiles(self, documents, n=3):
+        # one profile hypervector per document string
+        return np.stack([self.profile([doc], n).finalize() for doc in documents])
+
+def make_letter_hvs(alphabet=string.ascii_lowercase, seed=None):
+    letter_hvs = HDCodebook(name="letter", seed=seed)
+    letter_hvs.add_many(list(alphabet))
+    return letter_hvs
+    # raise Exception("return a codebook of letter hypervectors") 
+    
+def make_word(letter_codebook, word):
+    res = []
+    for i, letter in enumerate(word):
+        vec = HDC.permute(letter_codebook.get(letter), i)
+        res.append(vec)
+    return HDC.bind_all(res)
+    # raise Exception("make a word using the letter codebook") 
+    
+def make_words(codebooks, word, alphabet=string.ascii_lowercase):
+    # make_word for a (T, letters, .) stack of letter codebooks at once -> (T, .);
+    # codebooks[:, k] is the letter alphabet[k]
+    res = None
+    for i, letter in enumerate(word):
+        vec = HDC.permute(codebooks[:, alphabet.index(letter)], i)
+        res = vec if res is None else HDC.bind(res, vec)
+    return res
@@ -0,0 +1,29 @@
+"""
+Optional dependencies, imported on first use so that importing hdc needs only numpy.
+"""
+
+
+class _Quiet:
+    # stands in for a tqdm bar when tqdm is not installed
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def set_description(self, desc):
+        pass
+
+
+def progress(iterable, **kwargs):
+    # tqdm progress bar over iterable, or the plain iterable without tqdm
+    try:
+        import tqdm
+    except ImportError:
+        return _Quiet(iterable)
+    return tqdm.tqdm(iterable, **kwargs)
+
+def pyplot():
+    import matplotlib.pyplot as plt
+    return plt
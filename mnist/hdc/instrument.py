@@ -0,0 +1,171 @@
+"""
+Opt-in instrumentation of the hot paths: per-operation call counts, cumulative time and
+latency percentiles, the size of the arrays each call returns and item-memory scan sizes.
+While no profile is active an instrumented call costs one global lookup.
+
+result_bytes is the nbytes of the returned arrays, a measure of the output a call
+produces. It is not the memory the call allocated: temporaries are not counted, and a
+returned view counts the bytes it spans. bench.py reports peak allocations.
+
+    with instrument.profile() as prof:
+        classifier.predict_batch(images)
+    print(prof.table())
+    prof.save('profile.json')
+
+Times are inclusive, so HDItemMem.wta also counts the HDItemMem.distance_matrix and
+HDC.dist_matrix calls it makes.
+"""
+import contextlib
+import functools
+import json
+import random
+import threading
+import time
+import numpy as np
+
+
+class OpStats:
+    # running totals of one operation, latencies kept as a fixed-size reservoir sample
+    SAMPLES = 4096
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.result_bytes = 0
+        self.scanned = 0
+        self.samples = []
+        self.rng = random.Random(0)
+
+    def record(self, seconds, result_bytes=0, scanned=0):
+        self.calls += 1
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+        self.result_bytes += result_bytes
+        self.scanned += scanned
+        if len(self.samples) < self.SAMPLES:
+            self.samples.append(seconds)
+        else:
+            i = self.rng.randrange(self.calls)
+            if i < self.SAMPLES:
+                self.samples[i] = seconds
+
+    def summary(self):
+        p50, p90, p99 = np.percentile(self.samples, [50, 90, 99]) if self.samples else (0.0, 0.0, 0.0)
+        return dict(calls=self.calls, seconds=self.seconds, mean=self.seconds / max(1, self.calls),
+                    p50=float(p50), p90=float(p90), p99=float(p99), max=self.max,
+                    result_bytes=self.result_bytes, result_bytes_per_call=self.result_bytes / max(1, self.calls), scanned=self.scanned,
+                    scanned_per_call=self.scanned / max(1, self.calls))
+
+
+class Profile:
+    # OpStats by operation name; safe to record into from several threads
+
+    def __init__(self):
+        self.ops = {}
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def record(self, name, seconds, result_bytes=0, scanned=0):
+        with self.lock:
+            if name not in self.ops:
+                self.ops[name] = OpStats()
+            self.ops[name].record(seconds, result_bytes, scanned)
+
+    def reset(self):
+        with self.lock:
+            self.ops = {}
+            self.start = time.perf_counter()
+
+    def snapshot(self):
+        # plain dict, operations ordered by cumulative time
+        with self.lock:
+            ops = {name: stats.summary() for name, stats in self.ops.items()}
+        ops = dict(sorted(ops.items(), key=lambda item: -item[1]['seconds']))
+        return dict(wall_seconds=time.perf_counter() - self.start, ops=ops)
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    def table(self):
+        snap = self.snapshot()
+        lines = ["%-32s %8s %10s %10s %10s %10s %13s %12s" % ("operation", "calls", "total s", "p50 ms",
+                                                               "p99 ms", "max ms", "result B/call", "scanned/call")]
+        for name, s in snap['ops'].items():
+            lines.append("%-32s %8d %10.4f %10.4f %10.4f %10.4f %13.0f %12.0f" % (
+                name, s['calls'], s['seconds'], 1e3 * s['p50'], 1e3 * s['p99'], 1e3 * s['max'],
+                s['result_bytes_per_call'], s['scanned_per_call']))
+        lines.append("wall time %.4fs" % snap['wall_seconds'])
+        return "\n".join(lines)
+
+
+# the Profile being recorded into, None while instrumentation is off
+_active = None
+
+def active():
+    return _active
+
+def enable(prof=None):
+    global _active
+    _active = prof or Profile()
+    return _active
+
+def disable():
+    # stop recording, returns the profile that was active
+    global _active
+    prof, _active = _active, None
+    return prof
+
+@contextlib.contextmanager
+def profile(prof=None):
+    # record into prof (a fresh Profile by default) for the duration of the block
+    global _active
+    prev, _active = _active, prof or Profile()
+    try:
+        yield _active
+    finally:
+        _active = prev
+
+def result_bytes(res):
+    # bytes of the arrays a call returned, looking one level into tuples and lists
+    if isinstance(res, np.ndarray):
+        return res.nbytes
+    if isinstance(res, (tuple, list)):
+        return sum(r.nbytes for r in res if isinstance(r, np.ndarray))
+    return 0
+
+def timed(name=None, scan=None):
+    # decorator recording each call under name (the qualified name by default).
+    # scan(*args, **kwargs) gives the number of query x entry comparisons of the call.
+    def decorate(fxn):
+        label = name or fxn.__qualname__
+
+        @functools.wraps(fxn)
+        def wrapper(*args, **kwargs):
+            prof = _active
+            if prof is None:
+                return fxn(*args, **kwargs)
+            start = time.perf_counter()
+            res = fxn(*args, **kwargs)
+            prof.record(label, time.perf_counter() - start, result_bytes(res),
+                        scan(*args, **kwargs) if scan is not None else 0)
+            return res
+        return wrapper
+    return decorate
+
+@contextlib.contextmanager
+def region(name, scanned=0):
+    # time a block of code as the operation name
+    prof = _active
+    if prof is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.record(name, time.perf_counter() - start, 0, scanned)
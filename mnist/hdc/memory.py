@@ -0,0 +1,318 @@
+"""
+Item memories: keyed hypervectors with nearest-neighbour cleanup, codebooks that create
+the hypervectors of new keys, and an LSH index for large memories.
+"""
+import statistics
+import numpy as np
+from .core import HDC, HDAccumulator, WORD_BITS
+from .instrument import timed
+
+class HDItemMem:
+
+    def __init__(self,name=None) -> None:
+        self.name = name
+        # hypervectors are rows of one contiguous matrix, keys maps row -> key
+        self.keys = []
+        self.index = {}
+        self.matrix = None
+        # running bundles of the keys built up with accumulate/merge
+        self.accumulators = {}
+        # per-bit bit flip probabilities for the  hamming distance
+        self.prob_bit_flips = 0.0
+        # optional approximate index used by wta, rebuilt whenever version moves on
+        self.cleanup = None
+        # confidence at which wta may stop early, see wta_progressive; None scans all bits
+        self.early_exit = None
+        self.version = 0
+
+    def _reserve(self,rows,hv):
+        # make room for <rows> rows, growing by doubling so adds stay amortized O(1)
+        if self.matrix is None:
+            hv = np.asarray(hv)
+            self.matrix = np.empty((max(16, rows),) + hv.shape[-1:], dtype=hv.dtype)
+        elif rows > len(self.matrix):
+            grown = np.empty((max(rows, 2 * len(self.matrix)),) + self.matrix.shape[1:], dtype=self.matrix.dtype)
+            grown[:len(self.keys)] = self.vectors()
+            self.matrix = grown
+
+    def add(self,key,hv):
+        assert(not hv is None)
+        self.version += 1
+        if key in self.index:
+            self.matrix[self.index[key]] = hv
+            return
+        n = len(self.keys)
+        self._reserve(n + 1, hv)
+        self.matrix[n] = hv
+        self.index[key] = n
+        self.keys.append(key)
+
+    def add_many(self,keys,hvs):
+        # bulk add, row i of hvs stored under keys[i]. A key repeated within the call
+        # keeps its last row, as a sequence of add calls would.
+        hvs = np.asarray(hvs)
+        self.version += 1
+        last = {key: i for i, key in enumerate(keys)}
+        if len(last) < len(keys):
+            keys, hvs = list(last), hvs[list(last.values())]
+        new = [i for i, key in enumerate(keys) if key not in self.index]
+        if len(new) < len(keys):
+            old = [i for i, key in enumerate(keys) if key in self.index]
+            self.matrix[[self.index[keys[i]] for i in old]] = hvs[old]
+        n = len(self.keys)
+        self._reserve(n + len(new), hvs)
+        self.matrix[n:n + len(new)] = hvs[new]
+        for i in new:
+            self.index[keys[i]] = len(self.keys)
+            self.keys.append(keys[i])
+    
+    def merge(self,key,acc):
+        # fold an accumulator into the running bundle of key and refresh its hypervector
+        if key not in self.accumulators:
+            self.accumulators[key] = HDAccumulator()
+        self.accumulators[key].merge(acc)
+        self.add(key, self.accumulators[key].finalize())
+
+    def accumulate(self,key,hvs,weight=1):
+        # add (weight=1) or remove (weight=-1) hypervectors from the bundle stored under key
+        acc = HDAccumulator()
+        acc.add(hvs, weight)
+        self.merge(key, acc)
+
+    def get(self,key):
+        return self.matrix[self.index[key]]
+
+    def has(self,key):
+        return key in self.index
+
+    def vectors(self):
+        # N x D view of the stored hypervectors, in key order
+        if self.matrix is None:
+            return np.empty((0, HDC.words() if HDC.PACKED else HDC.SIZE))
+        return self.matrix[:len(self.keys)]
+
+    def set_cleanup(self,cleanup):
+        # route wta through an approximate index (e.g. HDBitSampleIndex), None for exact scans
+        self.cleanup = cleanup
+
+    @timed(scan=lambda self, queries, rows=None:
+           len(np.atleast_2d(queries)) * (len(self.keys) if rows is None else len(rows)))
+    def distance_matrix(self,queries,rows=None):
+        # Q x N hamming distances between a batch of queries and every row in item memory,
+        # or only the given rows. With bit flips every query sees its own noisy copy of the
+        # rows: of the d bits where a row differs from the query Binomial(d, p) flip back,
+        # of the SIZE - d others Binomial(SIZE - d, p) flip, drawn for each pair directly.
+        hvs = self.vectors() if rows is None else self.vectors()[rows]
+        if self.prob_bit_flips <= 0:
+            return HDC.dist_matrix(queries, hvs)
+        d = HDC.hamming_matrix(queries, hvs)
+        p = self.prob_bit_flips
+        return np.divide(d - HDC.rng.binomial(d, p) + HDC.rng.binomial(HDC.SIZE - d, p), HDC.SIZE)
+
+    @timed()
+    def distance(self,query):
+        # a single query gives {key: distance}, a Q x D batch gives the Q x N matrix
+        if np.ndim(query) > 1:
+            return self.distance_matrix(query)
+        return dict(zip(self.keys, self.distance_matrix(query)[0]))
+        # raise Exception("compute hamming distance between query vector and each row in item memory. Introduce bit flips if the bit flip probability is nonzero") 
+
+    def all_keys(self):
+        return list(self.keys)
+
+    def all_hvs(self):
+        return list(self.vectors())
+
+    @timed()
+    def wta(self,query,k=1):
+        # (key, dist) of the closest entry, or a list of the k closest.
+        # a Q x D batch returns one result per query.
+        if self.cleanup is not None:
+            return self._wta_cleanup(query, k)
+        if self.early_exit is not None and k == 1:
+            res = [(key, dist) for key, dist, _ in self.wta_progressive(np.atleast_2d(query), self.early_exit)]
+            return res if np.ndim(query) > 1 else res[0]
+        dists = self.distance_matrix(query)
+        if k == 1:
+            top = np.argmin(dists, axis=1)[:, None]
+        else:
+            top = np.argsort(dists, axis=1, kind='stable')[:, :k]
+        res = []
+        for row, idx in zip(dists, top):
+            hits = [(self.keys[i], row[i]) for i in idx]
+            res.append(hits[0] if k == 1 else hits)
+        return res if np.ndim(query) > 1 else res[0]
+        # raise Exception("winner-take-all querying") 
+        
+    def _wta_cleanup(self,query,k):
+        # exact re-ranking of the index candidates, a full scan when there are fewer than k
+        if self.cleanup.version != self.version:
+            self.cleanup.build(self.vectors())
+            self.cleanup.version = self.version
+        queries = np.atleast_2d(query)
+        res = []
+        for q, rows in zip(queries, self.cleanup.candidates(queries)):
+            if len(rows) < k:
+                rows = np.arange(len(self.keys))
+            dists = self.distance_matrix(q, rows)[0]
+            hits = [(self.keys[rows[i]], dists[i]) for i in np.argsort(dists, kind='stable')[:k]]
+            res.append(hits[0] if k == 1 else hits)
+        return res if np.ndim(query) > 1 else res[0]
+
+    @timed(scan=lambda self, query, *args, **kwargs: len(np.atleast_2d(query)) * len(self.keys))
+    def wta_progressive(self,query,confidence=0.99,block=512,chunk=1 << 14):
+        # early-exit winner-take-all. Distances are accumulated <block> bits at a time and
+        # after every block the entries whose distance exceeds the current leader's by a
+        # significant margin are dropped: a one-sided z-test on the per-bit difference,
+        # at <confidence> with a Bonferroni correction over the entries and a finite
+        # population correction for the bits left. A query stops when one entry is left.
+        # Queries advance through the blocks together, about <chunk> / N of them at a time.
+        # returns (key, dist, bits examined), dist measured on the examined bits only.
+        hvs = self.vectors()
+        queries = np.atleast_2d(query)
+        if len(hvs) == 1:
+            # a single entry, nothing to compare against
+            res = [(self.keys[0], d, HDC.SIZE) for d in self.distance_matrix(queries)[:, 0]]
+            return res if np.ndim(query) > 1 else res[0]
+        step = max(1, block // WORD_BITS) if HDC.PACKED else block
+        z = statistics.NormalDist().inv_cdf(1 - (1 - confidence) / max(2, len(hvs)))
+        # with bit flips every query is compared against its own noisy copy of the memory
+        rows = 1 if self.prob_bit_flips > 0 else max(1, chunk // len(hvs))
+        res = []
+        for i in range(0, len(queries), rows):
+            noisy = HDC.apply_bit_flips(hvs, self.prob_bit_flips) if self.prob_bit_flips > 0 else hvs
+            lead, dists, bits = self._progressive(queries[i:i + rows], noisy, z, step)
+            res += [(self.keys[l], d, b) for l, d, b in zip(lead, dists, bits)]
+        return res if np.ndim(query) > 1 else res[0]
+
+    def _progressive(self,queries,hvs,z,step):
+        # leaders, their distances and the bits examined for a batch of queries. Each
+        # block is compared against the entries still alive for some query of the batch.
+        alive = np.ones((len(queries), len(hvs)), dtype=bool)
+        counts = np.zeros((len(queries), len(hvs)), dtype=np.int64)
+        # bits where an entry and the query's leader disagree, the variance of the difference
+        disagree = np.zeros((len(queries), len(hvs)), dtype=np.int64)
+        lead = np.full(len(queries), -1)
+        examined = np.zeros(len(queries), dtype=np.int64)
+        active, cols, end, bits = np.arange(len(queries)), np.arange(len(hvs)), 0, 0
+        while len(active) and bits < HDC.SIZE:
+            start, end = end, end + step
+            bits = min(end * WORD_BITS, HDC.SIZE) if HDC.PACKED else min(end, HDC.SIZE)
+            grid = (active[:, None], cols)
+            counts[grid] += HDC.hamming_matrix(queries[active, start:end], hvs[cols, start:end])
+            live, c, d = alive[grid], counts[grid], disagree[grid]
+            pick = np.argmin(np.where(live, c, np.iinfo(np.int64).max), axis=1)
+            kept = lead[active] == cols[pick]
+            lead[active] = cols[pick]
+            if kept.any():
+                leaders, which = np.unique(lead[active[kept]], return_inverse=True)
+                d[kept] += HDC.hamming_matrix(hvs[leaders, start:end], hvs[cols, start:end])[which]
+            if not kept.all():
+                # a new leader is compared on every examined bit
+                leaders, which = np.unique(lead[active[~kept]], return_inverse=True)
+                d[~kept] = HDC.hamming_matrix(hvs[leaders, :end], hvs[cols, :end])[which]
+            disagree[grid] = d
+            diff = (c - c[np.arange(len(active)), pick][:, None]) / bits
+            var = np.maximum(d / bits - diff ** 2, 1.0 / bits)
+            var *= max(0.0, (HDC.SIZE - bits) / (HDC.SIZE - 1)) / bits
+            live &= diff <= z * np.sqrt(var)
+            alive[grid] = live
+            examined[active] = bits
+            more = live.sum(axis=1) > 1
+            active, cols = active[more], cols[live[more].any(axis=0)]
+        return lead, counts[np.arange(len(queries)), lead] / examined, examined
+
+    @timed()
+    def matches(self,query, threshold=0.49):
+        # {key: dist} of every entry closer than threshold, one dict per query for a batch
+        dists = self.distance_matrix(query)
+        res = []
+        for row in dists:
+            hits = np.flatnonzero(row < threshold)
+            res.append({self.keys[i]: row[i] for i in hits})
+        return res if np.ndim(query) > 1 else res[0]
+        # raise Exception("threshold-based querying") 
+        
+
+class HDBitSampleIndex:
+    # Approximate cleanup for large item memories: LSH on sampled bits. Each of <tables>
+    # hash tables keys every stored hypervector by <bits> randomly chosen dimensions, and a
+    # query is only compared exactly against the entries it collides with in some table.
+    # Two vectors at distance d collide in a table with probability (1 - d) ** bits, so
+    # more tables or fewer bits raise recall at the cost of more candidates per query.
+
+    def __init__(self, tables=32, bits=12, chunk=4096):
+        self.tables = tables
+        self.bits = bits
+        self.chunk = chunk
+        self.positions = HDC.rng.integers(HDC.SIZE, size=(tables, bits))
+        self.version = None
+
+    def codes(self, hvs):
+        # N x tables integer hash keys
+        hvs = np.atleast_2d(hvs)
+        weights = np.uint64(1) << np.arange(self.bits, dtype=np.uint64)
+        res = []
+        for i in range(0, len(hvs), self.chunk):
+            block = hvs[i:i + self.chunk]
+            if HDC.PACKED:
+                bits = block[:, self.positions // WORD_BITS] >> (self.positions % WORD_BITS).astype(np.uint64)
+            else:
+                bits = block[:, self.positions].astype(np.uint64)
+            res.append(np.sum((bits & np.uint64(1)) * weights, axis=-1, dtype=np.uint64))
+        return np.concatenate(res) if res else np.zeros((0, self.tables), dtype=np.uint64)
+
+    def build(self, hvs):
+        # per table: the stored rows sorted by hash key, so a bucket is one searchsorted range
+        codes = self.codes(hvs).T
+        self.order = np.argsort(codes, axis=1, kind='stable')
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+
+    def candidates(self, queries):
+        # rows sharing a bucket with each query, one sorted array per query
+        codes = self.codes(queries)
+        lo = np.stack([np.searchsorted(self.sorted_codes[t], codes[:, t], 'left') for t in range(self.tables)], axis=1)
+        hi = np.stack([np.searchsorted(self.sorted_codes[t], codes[:, t], 'right') for t in range(self.tables)], axis=1)
+        res = []
+        for q in range(len(codes)):
+            rows = [self.order[t, lo[q, t]:hi[q, t]] for t in range(self.tables) if hi[q, t] > lo[q, t]]
+            res.append(np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64))
+        return res
+
+
+# a codebook is simply an item memory that always creates a random hypervector
+# when a key is added. With a seed the hypervector of a key is HDC.keyed_vecs of
+# (seed, key), so the codebook never has to be stored or shipped: pickling sends
+# only the keys and the copy regenerates the vectors.
+class HDCodebook(HDItemMem):
+
+    def __init__(self,name=None,seed=None):
+        HDItemMem.__init__(self,name)
+        self.seed = seed
+
+    def make(self,keys):
+        if self.seed is None:
+            return HDC.rand_vec(len(keys))
+        return HDC.keyed_vecs(keys, self.seed)
+
+    def add(self,key):
+        hv = self.make([key])[0]
+        HDItemMem.add(self, key, hv)
+        return hv
+
+    def add_many(self,keys):
+        hvs = self.make(keys)
+        HDItemMem.add_many(self, keys, hvs)
+        return hvs
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.seed is not None:
+            state.update(matrix=None, size=HDC.SIZE, packed=HDC.PACKED)
+        return state
+
+    def __setstate__(self,state):
+        size, packed = state.pop('size', None), state.pop('packed', None)
+        self.__dict__.update(state)
+        if self.matrix is None:
+            self.matrix = HDC.keyed_vecs(self.keys, self.seed, size, packed)
@@ -0,0 +1,122 @@
+"""
+HDC model container shared by the Python scripts and the C runtime (embedded-hdc/main.c).
+
+Layout, all little-endian:
+    header   64 bytes, see HEADER below
+    codebook n_codebook rows of bit-packed position hypervectors
+    model    n_classes rows of bit-packed class hypervectors
+Each row is ceil(dims / word_bits) words. Bit k of a row is bit k % word_bits of word
+k // word_bits, so for every word size bit k is also bit k % 8 of byte k // 8.
+Sections start at 64-byte aligned offsets and the checksum is the CRC-32 of every byte
+after the header.
+
+With FLAG_SEEDED the codebook rows are HDC.keyed_vecs of the header seed for the keys
+x0..x{n/2-1}, y0..y{n/2-1}. The codebook section may then be left out (codebook offset 0),
+which needs format version 2; readers regenerate the rows from the seed.
+"""
+import struct
+import zlib
+import numpy as np
+from .core import HDC
+
+MAGIC = b'HDCM'
+VERSION = 2
+# magic, version, header size, dims, n_classes, n_codebook, word_bits, flags,
+# codebook offset, model offset, checksum, seed, reserved
+HEADER = struct.Struct('<4sHHIIIHHQQIQ12x')
+FLAG_SEEDED = 1
+ALIGN = 64
+
+
+def row_bytes(dims, word_bits):
+    return -(-dims // word_bits) * word_bits // 8
+
+def pack_rows(bits, word_bits=64):
+    # (rows, dims) array of 0/1 -> (rows, row_bytes) uint8 in the container bit order
+    bits = np.asarray(bits, dtype=np.uint8)
+    width = row_bytes(bits.shape[1], word_bits) * 8
+    padded = np.zeros((bits.shape[0], width), dtype=np.uint8)
+    padded[:, :bits.shape[1]] = bits
+    return np.packbits(padded, axis=1, bitorder='little')
+
+def unpack_rows(packed, dims):
+    # inverse of pack_rows, accepts any word view of the section
+    packed = np.ascontiguousarray(packed)
+    return np.unpackbits(packed.view(np.uint8), axis=1, bitorder='little')[:, :dims]
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+def codebook_keys(n_codebook):
+    half = n_codebook // 2
+    return ['x%d' % i for i in range(half)] + ['y%d' % j for j in range(half)]
+
+def seeded_codebook(header):
+    # regenerate the codebook bits of a FLAG_SEEDED model
+    return HDC.keyed_vecs(codebook_keys(header['n_codebook']), header['seed'], header['dims'], packed=False)
+
+def save_model(path, item_memory, codebook, word_bits=64, seed=None, store_codebook=True):
+    # item_memory (n_classes, dims) and codebook (n_codebook, dims) are arrays of bits.
+    # pass the seed of a keyed codebook to record it; without store_codebook only the
+    # seed is written and readers regenerate the rows (the C runtime cannot).
+    assert word_bits in (8, 16, 32, 64)
+    assert store_codebook or seed is not None
+    item_memory, codebook = np.asarray(item_memory), np.asarray(codebook)
+    dims = item_memory.shape[1]
+    assert codebook.shape[1] == dims
+
+    stride = row_bytes(dims, word_bits)
+    codebook_offset = ALIGN if store_codebook else 0
+    model_offset = _aligned(ALIGN + (len(codebook) * stride if store_codebook else 0))
+    end = model_offset + len(item_memory) * stride
+
+    body = np.zeros(end - ALIGN, dtype=np.uint8)
+    if store_codebook:
+        body[:len(codebook) * stride] = pack_rows(codebook, word_bits).ravel()
+    body[model_offset - ALIGN:] = pack_rows(item_memory, word_bits).ravel()
+    # files with the codebook stay readable by version 1 readers
+    header = HEADER.pack(MAGIC, 1 if store_codebook else VERSION, HEADER.size, dims, len(item_memory),
+                         len(codebook), word_bits, 0 if seed is None else FLAG_SEEDED, codebook_offset,
+                         model_offset, zlib.crc32(body), seed or 0)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(body.tobytes())
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError("%s: truncated header" % path)
+    (magic, version, header_size, dims, n_classes, n_codebook, word_bits, flags,
+     codebook_offset, model_offset, checksum, seed) = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("%s: not an HDC model file" % path)
+    if version > VERSION:
+        raise ValueError("%s: model format version %d is newer than %d" % (path, version, VERSION))
+    if header_size != HEADER.size:
+        raise ValueError("%s: bad header size %d" % (path, header_size))
+    if word_bits not in (8, 16, 32, 64):
+        raise ValueError("%s: unsupported word size %d" % (path, word_bits))
+    return dict(version=version, header_size=header_size, dims=dims, n_classes=n_classes,
+                n_codebook=n_codebook, word_bits=word_bits, flags=flags,
+                codebook_offset=codebook_offset, model_offset=model_offset, checksum=checksum,
+                seed=seed if flags & FLAG_SEEDED else None)
+
+def load_model(path, verify=True):
+    # (header, item_memory, codebook). The sections are read-only memmaps of packed
+    # words (dtype uint<word_bits>), nothing is copied; unpack_rows gives the bits.
+    # codebook is None when it was left out, see seeded_codebook.
+    header = read_header(path)
+    words = -(-header['dims'] // header['word_bits'])
+    dtype = np.dtype('<u%d' % (header['word_bits'] // 8))
+    if verify:
+        body = np.memmap(path, dtype=np.uint8, mode='r', offset=header['header_size'])
+        if zlib.crc32(body) != header['checksum']:
+            raise ValueError("%s: checksum mismatch" % path)
+    item_memory = np.memmap(path, dtype=dtype, mode='r', offset=header['model_offset'],
+                            shape=(header['n_classes'], words))
+    codebook = None
+    if header['codebook_offset']:
+        codebook = np.memmap(path, dtype=dtype, mode='r', offset=header['codebook_offset'],
+                             shape=(header['n_codebook'], words))
+    return header, item_memory, codebook
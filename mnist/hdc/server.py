@@ -0,0 +1,258 @@
+"""
+Asyncio query server speaking JSON lines over a Unix socket or localhost TCP. The model
+stays resident, and concurrent requests for the same operation are coalesced into
+micro-batches: a batch is flushed <window> seconds after its first request or as soon as
+it holds <max_batch> requests, and runs as one vectorized call in a thread pool while
+the event loop keeps reading. While a batch runs the next one fills up behind it.
+
+One request per line; responses echo the id and may come back out of order:
+
+    {"id": 1, "op": "get_value", "key": "Lotosmon", "field": "Stage"}
+    {"id": 1, "result": "Ultimate"}
+    {"id": 2, "op": "classify", "image": [[0, 255, ...], ...]}
+    {"id": 2, "error": "timeout"}
+
+Operations come from handler tables, {op: fxn(list of requests) -> list of results};
+see database_handlers and classifier_handlers.
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import numpy as np
+
+# longest request line accepted, a 28 x 28 image is about 3 KB
+LINE_LIMIT = 1 << 20
+
+
+class Overloaded(Exception):
+    pass
+
+
+class _Failed:
+    # the error of one request of a batch
+    def __init__(self, error):
+        self.error = error
+
+
+def _run_batch(fxn, requests):
+    # a batch that fails is retried one request at a time, so a bad request only
+    # fails itself
+    try:
+        return fxn(requests)
+    except Exception:
+        if len(requests) == 1:
+            raise
+    res = []
+    for request in requests:
+        try:
+            res.append(fxn([request])[0])
+        except Exception as e:
+            res.append(_Failed(e))
+    return res
+
+
+class MicroBatcher:
+    # coalesces the submits of one operation into batches, at most one in flight
+
+    def __init__(self, fxn, executor, window=0.002, max_batch=256, max_pending=4096):
+        self.fxn = fxn
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        # (request, future) pairs waiting for the next batch
+        self.queue = []
+        self.timer = None
+        self.running = False
+
+    async def submit(self, request):
+        if len(self.queue) >= self.max_pending:
+            raise Overloaded()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((request, future))
+        if not self.running:
+            if len(self.queue) >= self.max_batch:
+                self.flush()
+            elif self.timer is None:
+                self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch = []
+        while self.queue and not batch:
+            # requests that timed out while queued are dropped
+            batch = [(r, f) for r, f in self.queue[:self.max_batch] if not f.done()]
+            del self.queue[:self.max_batch]
+        if not batch:
+            return
+        self.running = True
+        task = asyncio.get_running_loop().run_in_executor(self.executor, _run_batch, self.fxn,
+                                                          [r for r, _ in batch])
+        task.add_done_callback(lambda task: self.done(batch, task))
+
+    def done(self, batch, task):
+        self.running = False
+        error = task.exception()
+        results = [_Failed(error)] * len(batch) if error is not None else task.result()
+        for (_, future), res in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(res, _Failed):
+                future.set_exception(res.error)
+            else:
+                future.set_result(res)
+        if self.queue:
+            self.flush()
+
+
+def _jsonable(x):
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    raise TypeError("%s is not JSON serializable" % type(x).__name__)
+
+
+class HDServer:
+    # serves the operations of one or more handler tables. Each connection has at most
+    # <max_inflight> requests in flight; past that it is not read until one completes,
+    # and each batcher rejects requests once <max_pending> are queued.
+
+    def __init__(self, handlers, window=0.002, max_batch=256, max_pending=4096, timeout=5.0,
+                 max_inflight=256, workers=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.batchers = {op: MicroBatcher(fxn, self.executor, window, max_batch, max_pending)
+                         for op, fxn in handlers.items()}
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+
+    async def respond(self, line, writer):
+        rid = None
+        try:
+            request = json.loads(line)
+            rid = request.get('id')
+            if request.get('op') not in self.batchers:
+                raise KeyError("unknown op %r" % request.get('op'))
+            result = await asyncio.wait_for(self.batchers[request['op']].submit(request), self.timeout)
+            reply = dict(id=rid, result=result)
+        except asyncio.TimeoutError:
+            reply = dict(id=rid, error="timeout")
+        except Overloaded:
+            reply = dict(id=rid, error="overloaded")
+        except Exception as e:
+            reply = dict(id=rid, error="%s: %s" % (type(e).__name__, e))
+        writer.write((json.dumps(reply, default=_jsonable) + "\n").encode())
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        slots = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+
+        def release(task):
+            tasks.discard(task)
+            slots.release()
+
+        try:
+            while line := await reader.readline():
+                await slots.acquire()
+                task = asyncio.ensure_future(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(release)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError):
+            # a dropped client, or a line longer than LINE_LIMIT
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, path=None, host='127.0.0.1', port=8765):
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+    async def serve_forever(self, path=None, host='127.0.0.1', port=8765):
+        server = await self.start(path, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class HDClient:
+    # many concurrent calls multiplexed over one connection
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.pending = {}
+        self.next_id = 0
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def connect(cls, path=None, host='127.0.0.1', port=8765):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=LINE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        return cls(reader, writer)
+
+    async def receive(self):
+        while line := await self.reader.readline():
+            reply = json.loads(line)
+            future = self.pending.pop(reply['id'], None)
+            if future is None or future.done():
+                continue
+            if 'error' in reply:
+                future.set_exception(RuntimeError(reply['error']))
+            else:
+                future.set_result(reply['result'])
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("server closed the connection"))
+
+    async def call(self, op, **args):
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        self.writer.write((json.dumps(dict(args, id=self.next_id, op=op), default=_jsonable) + "\n").encode())
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+def database_handlers(db):
+    # queries may add unseen strings to the codebook, so database batches run one at a time
+    lock = threading.Lock()
+
+    def locked(fxn):
+        def run(requests):
+            with lock:
+                return fxn(requests)
+        return run
+
+    def get_matches(requests):
+        # one scan per distinct threshold
+        res = [None] * len(requests)
+        for threshold in {r.get('threshold', 0.4) for r in requests}:
+            group = [i for i, r in enumerate(requests) if r.get('threshold', 0.4) == threshold]
+            for i, hits in zip(group, db.get_matches_batch([requests[i]['fields'] for i in group], threshold)):
+                res[i] = hits
+        return res
+
+    return dict(get_value=locked(lambda rs: db.get_value_batch([(r['key'], r['field']) for r in rs])),
+                get_matches=locked(get_matches),
+                get_analogy=locked(lambda rs: [dict(value=value, dist=dist) for value, dist in db.get_analogy_batch(
+                    [(r['target_key'], r['other_key'], r['target_value']) for r in rs])]))
+
+
+def classifier_handlers(encoder, classes):
+    # classify 28 x 28 images (nested lists of pixel values) with an HDImageEncoder and
+    # an item memory of class hypervectors
+    def classify(requests):
+        hvs = encoder.encode_batch(np.array([r['image'] for r in requests], dtype=np.uint8))
+        return [dict(label=label, dist=dist) for label, dist in classes.wta(hvs)]
+    return dict(classify=classify)
@@ -0,0 +1,127 @@
+"""
+Monte-Carlo studies of distance distributions. Plotting and progress bars are optional
+extras, imported only when used.
+"""
+import functools
+import multiprocessing
+import numpy as np
+from .core import HDC
+from .encoders import make_words
+from . import extras
+
+def word_distance_trials(n, w1, w2, prob_error=0.0):
+    # distances between w1 and w2 under n independent letter codebooks. letters outside
+    # the two words cannot change the distance, so only theirs are drawn
+    alphabet = ''.join(sorted(set(w1 + w2)))
+    codebooks = HDC.rand_vec(n * len(alphabet)).reshape(n, len(alphabet), -1)
+    hv1, hv2 = make_words(codebooks, w1, alphabet), make_words(codebooks, w2, alphabet)
+    if prob_error > 0:
+        hv1 = HDC.apply_bit_flips(hv1, prob_error)
+        hv2 = HDC.apply_bit_flips(hv2, prob_error)
+    return HDC.dist(hv1, hv2)
+
+
+class HDDistanceStats:
+    # running summary of distances: count, mean and variance (merged with the pairwise
+    # update of Chan et al., so partial results from workers combine exactly), min, max
+    # and a histogram over the SIZE + 1 possible distances for quantiles and plots
+
+    def __init__(self, values=None):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = np.inf, -np.inf
+        self.histogram = np.zeros(HDC.SIZE + 1, dtype=np.int64)
+        if values is not None:
+            self.add(values)
+
+    def _combine(self, n, mean, m2):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values):
+            self._combine(len(values), values.mean(), np.sum((values - values.mean()) ** 2))
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+            self.histogram += np.bincount(np.rint(values * HDC.SIZE).astype(np.int64), minlength=HDC.SIZE + 1)
+        return self
+
+    def merge(self, other):
+        if other.n:
+            self._combine(other.n, other.mean, other.m2)
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self.histogram += other.histogram
+        return self
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def quantile(self, q):
+        return np.searchsorted(np.cumsum(self.histogram), q * self.n) / HDC.SIZE
+
+    def summary(self):
+        return dict(n=self.n, mean=self.mean, std=self.std(), min=self.min, max=self.max,
+                    p05=self.quantile(0.05), p50=self.quantile(0.5), p95=self.quantile(0.95))
+
+
+def _monte_carlo_chunk(job):
+    # one chunk of trials on its own random stream, HDC.rng is put back afterwards
+    fxn, n, seed, size, packed = job
+    saved = HDC.rng, HDC.SIZE, HDC.PACKED
+    HDC.rng, HDC.SIZE, HDC.PACKED = np.random.default_rng(seed), size, packed
+    try:
+        return HDDistanceStats(fxn(n))
+    finally:
+        HDC.rng, HDC.SIZE, HDC.PACKED = saved
+
+def monte_carlo(fxn,trials):
+    results = list(map(lambda i: fxn(), extras.progress(range(trials))))
+    return results
+
+def monte_carlo_batched(fxn, trials, batch=1024, processes=1, seed=None, progress=True):
+    # fxn(n) runs n trials at once and returns their n distances. trials are split into
+    # chunks of <batch>, each drawing from its own SeedSequence child, so the summary
+    # depends on the seed and the batch size but not on how many processes ran it.
+    # with processes > 1, fxn has to be picklable (a module-level function or a partial)
+    seeds = np.random.SeedSequence(seed).spawn(-(-trials // batch))
+    jobs = [(fxn, min(batch, trials - i * batch), s, HDC.SIZE, HDC.PACKED) for i, s in enumerate(seeds)]
+    stats = HDDistanceStats()
+    if processes == 1:
+        for part in extras.progress(map(_monte_carlo_chunk, jobs), total=len(jobs), disable=not progress):
+            stats.merge(part)
+        return stats
+    with multiprocessing.Pool(processes) as pool:
+        for part in extras.progress(pool.imap(_monte_carlo_chunk, jobs), total=len(jobs), disable=not progress):
+            stats.merge(part)
+    return stats
+
+def plot_dist_distributions(key1, dist1, key2, dist2):
+    # dist1 / dist2 are lists of distances or HDDistanceStats
+    plt = extras.pyplot()
+    for key, dist in ((key1, dist1), (key2, dist2)):
+        if isinstance(dist, HDDistanceStats):
+            plt.hist(np.arange(HDC.SIZE + 1) / HDC.SIZE, weights=dist.histogram, range=(dist.min, dist.max),
+                     alpha=0.75, label=key)
+        else:
+            plt.hist(dist, alpha=0.75, label=key)
+    
+    plt.legend(loc='upper right') 
+    plt.title('Distance distribution for Two Words') 
+    plt.show()
+    plt.clf()
+
+def study_distributions(trials=1000, processes=1, seed=None, plot=True):
+    # every trial draws a fresh letter codebook; plot=False runs headless and only
+    # prints the summaries. returns {(word, prob_error): HDDistanceStats}
+    results = {}
+    for perr in (0.0, 0.10):
+        for word in ("box", "car"):
+            fxn = functools.partial(word_distance_trials, w1="fox", w2=word, prob_error=perr)
+            stats = monte_carlo_batched(fxn, trials, processes=processes, seed=seed, progress=plot)
+            results[word, perr] = stats
+            print("fox-%s prob_error=%.2f: %s" % (word, perr, stats.summary()))
+        if plot:
+            plot_dist_distributions("box", results["box", perr], "car", results["car", perr])
+    return results
@@ -0,0 +1,29 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+MNIST = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MNIST)
+
+from hdc import HDC
+
+
+@pytest.fixture(autouse=True)
+def hdc_settings():
+    # every test starts from a seeded rng and leaves the global settings as it found them
+    prev = HDC.SIZE, HDC.PACKED, HDC.SEED, HDC.rng
+    HDC.seed(0)
+    yield
+    HDC.SIZE, HDC.PACKED, HDC.SEED, HDC.rng = prev
+
+
+def load_script(name):
+    # a hyphenated script of this directory (hdc-ml.py) as an importable module, so that
+    # pool workers can unpickle its functions
+    module = name.replace('-', '_')
+    if module not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module, os.path.join(MNIST, name + '.py'))
+        sys.modules[module] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sys.modules[module])
+    return sys.modules[module]
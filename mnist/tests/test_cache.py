@@ -0,0 +1,106 @@
+import concurrent.futures
+import os
+import numpy as np
+import pytest
+from hdc import HDC, HDEncodingCache, HDImageEncoder, dataset_identity
+from hdc.data import MNISTData
+
+WORKERS, ROWS = 8, 2000
+
+
+def stamp(indices):
+    # encodings that say which index they were made for
+    return np.array([np.full(HDC.words(), i + 1, dtype=np.uint64) for i in indices])
+
+
+def test_encode_calls_only_for_misses(tmp_path):
+    HDC.SIZE, HDC.PACKED = 256, True
+    cache = HDEncodingCache('fp', str(tmp_path))
+    calls = []
+
+    def encode(inputs):
+        calls.append(list(inputs))
+        return stamp(inputs)
+
+    np.testing.assert_array_equal(cache.encode([3, 5], [3, 5], encode), stamp([3, 5]))
+    np.testing.assert_array_equal(cache.encode([5, 9, 3], [5, 9, 3], encode), stamp([5, 9, 3]))
+    assert calls == [[3, 5], [9]]
+    # a new cache object reads what the first one wrote
+    hit, hvs = HDEncodingCache('fp', str(tmp_path)).lookup([3, 4, 9])
+    assert hit.tolist() == [True, False, True]
+    np.testing.assert_array_equal(hvs, stamp([3, 9]))
+
+
+def test_unpacked_callers_get_their_layout_back(tmp_path):
+    HDC.SIZE, HDC.PACKED = 300, False
+    bits = HDC.rand_vec(4)
+    cache = HDEncodingCache('fp', str(tmp_path))
+    cache.encode(range(4), bits, lambda inputs: np.array(inputs))
+    hit, hvs = cache.lookup(range(4))
+    assert hit.all()
+    np.testing.assert_array_equal(hvs, bits)
+
+
+def test_fingerprint_covers_codebook_width_and_source(tmp_path):
+    HDC.SIZE = 256
+    table = np.zeros((4, 256), dtype=np.uint8)
+    fp = HDEncodingCache.fingerprint_of(table, source='a')
+    assert fp == HDEncodingCache.fingerprint_of(table.copy(), source='a')
+    assert fp != HDEncodingCache.fingerprint_of(table, source='b')
+    table[1, 7] = 1
+    assert fp != HDEncodingCache.fingerprint_of(table, source='a')
+    HDC.SIZE = 512
+    assert fp != HDEncodingCache.fingerprint_of(table[:, :256] * 0, source='a')
+
+
+def test_dataset_identity_changes_with_file_and_threshold():
+    images, labels = np.zeros((4, 28, 28), dtype=np.uint8), np.zeros(4, dtype=np.int64)
+    a = MNISTData(images, labels, source='train:1:1')
+    assert dataset_identity(a) == dataset_identity(a.subset([1, 2]))
+    assert dataset_identity(a) != dataset_identity(MNISTData(images, labels, source='train:1:2'))
+    assert dataset_identity(a) != dataset_identity(MNISTData(images, labels, threshold=64, source='train:1:1'))
+    assert dataset_identity(MNISTData(images, labels)) is None
+
+
+def test_eviction_keeps_the_current_fingerprint(tmp_path):
+    HDC.SIZE, HDC.PACKED = 256, True
+    old = HDEncodingCache('old', str(tmp_path))
+    old.store(np.arange(100), stamp(range(100)))
+    os.utime(str(tmp_path / 'old.hv'), (0, 0))
+    os.utime(str(tmp_path / 'old.ok'), (0, 0))
+    new = HDEncodingCache('new', str(tmp_path), max_bytes=150 * 33)
+    new.store(np.arange(100), stamp(range(100)))
+    assert not (tmp_path / 'old.hv').exists()
+    assert new.lookup(np.arange(100))[0].all()
+
+
+def _fill(args):
+    # one worker storing every WORKERS-th row, one row at a time, so the files keep growing
+    # while the other workers write
+    cache, worker = args
+    HDC.SIZE, HDC.PACKED = 256, True
+    for i in range(worker, ROWS, WORKERS):
+        cache.encode([i], [i], stamp)
+    return worker
+
+
+def test_concurrent_workers_never_lose_rows(tmp_path):
+    HDC.SIZE, HDC.PACKED = 256, True
+    cache = HDEncodingCache('fp', str(tmp_path))
+    with concurrent.futures.ProcessPoolExecutor(WORKERS) as pool:
+        assert sorted(pool.map(_fill, [(cache, w) for w in range(WORKERS)])) == list(range(WORKERS))
+    hit, hvs = HDEncodingCache('fp', str(tmp_path)).lookup(np.arange(ROWS))
+    assert hit.all()
+    np.testing.assert_array_equal(hvs, stamp(range(ROWS)))
+
+
+def test_image_encodings_round_trip(tmp_path):
+    HDC.SIZE, HDC.PACKED = 1024, True
+    positions = HDC.rand_vec(56)
+    encoder = HDImageEncoder(positions[:28], positions[28:])
+    images = np.where(HDC.rng.random((6, 28, 28)) < 0.3, 255, 0).astype(np.uint8)
+    cache = HDEncodingCache('img', str(tmp_path))
+    first = cache.encode(range(6), images, encoder.encode_batch)
+    again = cache.encode(range(6), images, pytest.fail)
+    np.testing.assert_array_equal(first, encoder.encode_batch(images))
+    np.testing.assert_array_equal(again, first)
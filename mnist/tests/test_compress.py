@@ -0,0 +1,95 @@
+import argparse
+import numpy as np
+import pytest
+from conftest import load_script
+from hdc import HDC, HDItemMem, HDDatabase, WORD_BITS
+from hdc import compress
+
+
+@pytest.fixture(params=[True, False], ids=['packed', 'unpacked'])
+def layout(request):
+    HDC.SIZE, HDC.PACKED = 4096, request.param
+
+
+def test_width_restores_the_size():
+    HDC.SIZE = 4096
+    with pytest.raises(RuntimeError):
+        with compress.width(128):
+            assert HDC.SIZE == 128
+            raise RuntimeError()
+    assert HDC.SIZE == 4096
+
+
+@pytest.mark.parametrize('size', [1000, 1024])
+def test_truncate_keeps_the_leading_dimensions(layout, size):
+    mem = HDItemMem()
+    mem.add_many(['a', 'b', 'c'], HDC.rand_vec(3))
+    bits = HDC.unpack(mem.vectors()) if HDC.PACKED else mem.vectors()
+    compress.truncate(mem, size)
+    with compress.width(size):
+        np.testing.assert_array_equal(HDC.unpack(mem.vectors()) if HDC.PACKED else mem.vectors(), bits[:, :size])
+        if HDC.PACKED:
+            np.testing.assert_array_equal(HDC.clear_padding(mem.vectors().copy()), mem.vectors())
+        assert mem.wta(mem.get('b'))[0] == 'b'
+
+
+def test_truncate_leaves_empty_memories_alone(layout):
+    mem = compress.truncate(HDItemMem(), 1024)
+    assert mem.matrix is None
+    with compress.width(1024):
+        mem.add('a', HDC.rand_vec())
+        assert mem.vectors().shape == (1, 16 if HDC.PACKED else 1024)
+
+
+def test_truncated_database_answers_queries(layout):
+    db = HDDatabase()
+    db.bulk_load(('row%d' % i, dict(a='a%d' % (i % 7), b='b%d' % (i % 5), c='c%d' % i)) for i in range(40))
+    db.field_codebooks['unused'] = HDItemMem('unused')
+    small = compress.truncate_database(db, 2048)
+    assert db.db.vectors().shape[1] == (HDC.words() if HDC.PACKED else HDC.SIZE)
+    with compress.width(2048):
+        assert small.get_value_batch([('row%d' % i, 'a') for i in range(40)]) == ['a%d' % (i % 7) for i in range(40)]
+
+
+def test_class_bit_counts(layout):
+    hvs, labels = HDC.rand_vec(50), HDC.rng.integers(3, size=50)
+    counts, totals = compress.class_bit_counts(hvs, labels, 4, chunk=16)
+    bits = HDC.unpack(hvs) if HDC.PACKED else hvs
+    for c in range(4):
+        np.testing.assert_array_equal(counts[c], bits[labels == c].sum(axis=0))
+    assert totals.tolist() == np.bincount(labels, minlength=4).tolist()
+
+
+def test_scores_rank_informative_words_first():
+    HDC.SIZE, HDC.PACKED = 1024, True
+    # word 5 carries the label, every other bit is noise
+    labels = HDC.rng.integers(2, size=400)
+    bits = HDC.rng.integers(2, size=(400, 1024))
+    bits[:, 5 * WORD_BITS:6 * WORD_BITS] = labels[:, None]
+    counts, totals = compress.class_bit_counts(HDC.pack(bits), labels, 2)
+    order = compress.word_order(compress.dimension_scores(counts, totals))
+    assert order[0] == 5
+    assert compress.word_order(np.zeros(1000), prefix=True).tolist() == list(range(15))
+    assert compress.word_dims(np.array([2, 0]))[[0, 63, 64, 127]].tolist() == [0, 63, 128, 191]
+
+
+def test_sweep_and_pick_width():
+    HDC.SIZE, HDC.PACKED = 1024, True
+    protos = HDC.rand_vec(4)
+    labels = HDC.rng.integers(4, size=100)
+    hvs = HDC.apply_bit_flips(protos[labels], 0.3)
+    results = compress.sweep(protos, hvs, labels, np.arange(16), [64, 256, 1024])
+    assert [r['dims'] for r in results] == [64, 256, 1024]
+    assert [r['model_bytes'] for r in results] == [32, 128, 512]
+    assert results[-1]['accuracy'] == 1.0
+    best = compress.pick_width(results, 0.0)
+    assert best == min(r['dims'] for r in results if r['accuracy'] == 1.0)
+    assert compress.pick_width(results, 1.0) == 64
+
+
+def test_widths_must_be_whole_words():
+    word_multiple = load_script('hdc-compress').word_multiple
+    assert word_multiple('128') == 128
+    for text in ('0', '-64', '100'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            word_multiple(text)
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from hdc import HDC, HDAccumulator
+
+# widths with and without a partial last word
+SIZES = [64, 1000, 10000]
+
+
+@pytest.fixture(params=SIZES)
+def bits(request):
+    HDC.SIZE, HDC.PACKED = request.param, False
+    return HDC.rand_vec(9)
+
+
+def packed(x, size):
+    HDC.SIZE, HDC.PACKED = size, True
+    return HDC.pack(x)
+
+
+def test_pack_round_trip(bits):
+    size = bits.shape[1]
+    words = packed(bits, size)
+    assert words.dtype == np.uint64 and words.shape == (9, -(-size // 64))
+    np.testing.assert_array_equal(HDC.unpack(words), bits)
+
+
+def test_dist_parity(bits):
+    size = bits.shape[1]
+    expected = HDC.dist(bits[0], bits[1:])
+    matrix = HDC.dist_matrix(bits[:3], bits)
+    words = packed(bits, size)
+    np.testing.assert_array_equal(HDC.dist(words[0], words[1:]), expected)
+    np.testing.assert_array_equal(HDC.dist_matrix(words[:3], words), matrix)
+
+
+def test_bundle_parity(bits):
+    size = bits.shape[1]
+    for n in (1, 2, 5, 9):
+        expected = HDC.bundle(bits[:n])
+        np.testing.assert_array_equal(HDC.unpack(HDC.bundle(packed(bits[:n], size))), expected)
+        HDC.PACKED = False
+
+
+@pytest.mark.parametrize('shift', [1, -1, 3, 64, 65, 999])
+def test_permute_parity(bits, shift):
+    size = bits.shape[1]
+    expected = HDC.permute(bits, shift)
+    words = HDC.permute(packed(bits, size), shift)
+    np.testing.assert_array_equal(HDC.unpack(words), expected)
+    # nothing leaks into the padding of the last word
+    np.testing.assert_array_equal(HDC.clear_padding(words.copy()), words)
+
+
+def test_bind_parity(bits):
+    size = bits.shape[1]
+    expected = HDC.bind(bits[0], bits[1])
+    words = packed(bits, size)
+    np.testing.assert_array_equal(HDC.unpack(HDC.bind(words[0], words[1])), expected)
+
+
+def test_hamming_matrix_on_slices():
+    HDC.SIZE, HDC.PACKED = 1024, True
+    xs, ys = HDC.rand_vec(4), HDC.rand_vec(6)
+    whole = HDC.hamming_matrix(xs, ys)
+    parts = sum(HDC.hamming_matrix(xs[:, i:i + 3], ys[:, i:i + 3]) for i in range(0, HDC.words(), 3))
+    np.testing.assert_array_equal(parts, whole)
+
+
+def test_accumulator_matches_bundle():
+    HDC.SIZE, HDC.PACKED = 1000, True
+    xs = HDC.rand_vec(7)
+    acc = HDAccumulator()
+    acc.add(xs[:4])
+    acc.add(xs[4:])
+    np.testing.assert_array_equal(acc.finalize(), HDC.bundle(xs))
+
+
+def test_keyed_vecs_prefix():
+    # a keyed codebook at a smaller width is the prefix of the larger one
+    small = HDC.keyed_vecs(['x0', 'y3'], 7, 1000, packed=False)
+    large = HDC.keyed_vecs(['x0', 'y3'], 7, 10000, packed=False)
+    np.testing.assert_array_equal(large[:, :1000], small)
+
+
+@pytest.mark.parametrize('packed', [True, False], ids=['packed', 'unpacked'])
+@pytest.mark.parametrize('p', [0.001, 0.03, 0.2])
+@pytest.mark.parametrize('chunk', [64, 1 << 18])
+def test_bit_flip_rate(monkeypatch, packed, p, chunk):
+    # small chunks make both paths draw in many steps
+    monkeypatch.setattr(HDC, 'FLIP_CHUNK', chunk)
+    HDC.SIZE, HDC.PACKED = 1000, packed
+    x = HDC.rand_vec(1000)
+    before = x.copy()
+    y = HDC.apply_bit_flips(x, p)
+    np.testing.assert_array_equal(x, before)
+    flips = HDC.unpack(x ^ y) if packed else x ^ y
+    assert abs(flips.mean() - p) < 5 * np.sqrt(p / flips.size)
+    # every row gets flips, not only the first ones
+    assert abs(flips[500:].mean() - p) < 5 * np.sqrt(p / flips[500:].size)
+    if packed:
+        np.testing.assert_array_equal(HDC.clear_padding(y.copy()), y)
+    np.testing.assert_array_equal(HDC.apply_bit_flips(x[0], 0.0), x[0])
@@ -0,0 +1,47 @@
+import pytest
+from hdc import HDC, HDDatabase
+
+ROWS = [('Agumon', dict(Stage='Rookie', Type='Vaccine', Attribute='Fire')),
+        ('Gabumon', dict(Stage='Rookie', Type='Data')),
+        ('Greymon', dict(Stage='Champion', Type='Vaccine', Attribute='Fire', Memory='4')),
+        ('Tentomon', dict(Type='Data', Attribute='Plant'))]
+
+
+@pytest.fixture(params=[True, False], ids=['packed', 'unpacked'])
+def db(request):
+    HDC.SIZE, HDC.PACKED = 10000, request.param
+    db = HDDatabase()
+    db.bulk_load(ROWS)
+    return db
+
+
+def test_get_rows_decodes_only_the_fields_a_row_has(db):
+    assert db.get_rows([key for key, _ in ROWS]) == [fields for _, fields in ROWS]
+    assert db.get_row('Tentomon') == ROWS[3][1]
+
+
+def test_remove_fields_drops_them_from_the_row(db):
+    db.remove_fields('Greymon', ['Memory', 'Type'])
+    assert db.get_row('Greymon') == dict(Stage='Champion', Attribute='Fire')
+
+
+def test_add_row_updates_existing_keys(db):
+    db.add_row('Gabumon', dict(Stage='Champion', Attribute='Ice'))
+    assert db.get_row('Gabumon') == dict(Stage='Champion', Type='Data', Attribute='Ice')
+    assert db.db.keys.count('Gabumon') == 1
+
+
+def test_bulk_load_in_blocks_matches_one_block(db):
+    small = HDDatabase()
+    small.bulk_load(ROWS, block=1)
+    assert small.get_rows([key for key, _ in ROWS]) == db.get_rows([key for key, _ in ROWS])
+
+
+def test_batched_queries_match_single_ones(db):
+    pairs = [('Agumon', 'Attribute'), ('Gabumon', 'Type'), ('Greymon', 'Stage'), ('Tentomon', 'Attribute')]
+    assert db.get_value_batch(pairs) == [db.get_value(key, field) for key, field in pairs]
+    assert db.get_value_batch(pairs) == ['Fire', 'Data', 'Champion', 'Plant']
+    assert db.get_analogy('Agumon', 'Tentomon', 'Fire')[0] == 'Plant'
+    query = dict(Type='Vaccine', Attribute='Fire')
+    assert set(db.get_matches(query, threshold=0.3)) == {'Agumon', 'Greymon'}
+    assert db.get_matches_batch([query, dict(Stage='Rookie')], 0.3)[0] == db.get_matches(query, threshold=0.3)
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from hdc import HDC, HDItemMem, HDBitSampleIndex
+
+
+@pytest.fixture(params=[True, False], ids=['packed', 'unpacked'])
+def layout(request):
+    HDC.SIZE, HDC.PACKED = 2048, request.param
+
+
+def noisy(hvs, p):
+    return HDC.apply_bit_flips(hvs, p)
+
+
+def test_add_many_repeated_keys_last_wins(layout):
+    keys = ['a', 'b', 'a', 'c', 'b', 'a']
+    hvs = HDC.rand_vec(len(keys))
+    bulk, one_by_one = HDItemMem(), HDItemMem()
+    bulk.add_many(keys, hvs)
+    for key, hv in zip(keys, hvs):
+        one_by_one.add(key, hv)
+    assert bulk.keys == one_by_one.keys == ['a', 'b', 'c']
+    np.testing.assert_array_equal(bulk.vectors(), one_by_one.vectors())
+    np.testing.assert_array_equal(bulk.get('a'), hvs[5])
+
+
+def test_add_many_updates_existing_keys(layout):
+    hvs = HDC.rand_vec(4)
+    mem = HDItemMem()
+    mem.add_many(['a', 'b'], hvs[:2])
+    mem.add_many(['b', 'c', 'c'], hvs[1:])
+    assert mem.keys == ['a', 'b', 'c']
+    np.testing.assert_array_equal(mem.vectors(), hvs[[0, 1, 3]])
+
+
+def test_wta_batch_matches_single_queries(layout):
+    mem = HDItemMem()
+    mem.add_many(list(range(20)), HDC.rand_vec(20))
+    queries = noisy(mem.vectors()[[3, 7, 7, 19]], 0.2)
+    batch = mem.wta(queries)
+    assert [key for key, _ in batch] == [3, 7, 7, 19]
+    assert batch == [mem.wta(q) for q in queries]
+    top = mem.wta(queries[0], k=3)
+    assert top[0][0] == 3 and [d for _, d in top] == sorted(d for _, d in top)
+
+
+def test_cleanup_index_finds_the_exact_winners(layout):
+    mem = HDItemMem()
+    mem.add_many(list(range(2000)), HDC.rand_vec(2000))
+    labels = HDC.rng.integers(2000, size=100)
+    queries = noisy(mem.vectors()[labels], 0.1)
+    exact = mem.wta(queries)
+    index = HDBitSampleIndex()
+    mem.set_cleanup(index)
+    assert mem.wta(queries) == exact
+    assert np.mean([len(rows) for rows in index.candidates(queries)]) < 200
+    # entries added later are indexed on the next query
+    mem.add('new', HDC.rand_vec())
+    assert mem.wta(mem.get('new')) == ('new', 0)
+
+
+@pytest.mark.parametrize('entries', [1, 10, 300])
+def test_wta_progressive_agrees_with_full_scan(layout, entries):
+    mem = HDItemMem()
+    mem.add_many(list(range(entries)), HDC.rand_vec(entries))
+    labels = HDC.rng.integers(entries, size=50)
+    queries = noisy(mem.vectors()[labels], 0.3)
+    exact = mem.wta(queries)
+    res = mem.wta_progressive(queries)
+    assert [key for key, _, _ in res] == [key for key, _ in exact]
+    for (_, dist, bits), (_, full) in zip(res, exact):
+        assert 0 < bits <= HDC.SIZE
+        if bits == HDC.SIZE:
+            assert dist == pytest.approx(full)
+    # batches give the same answers as single queries, whatever the chunking
+    assert mem.wta_progressive(queries[:5], chunk=entries) == [mem.wta_progressive(q) for q in queries[:5]]
+
+
+def test_wta_progressive_stops_early_on_close_calls():
+    # 10 correlated prototypes, as the MNIST class hypervectors are
+    HDC.SIZE, HDC.PACKED = 10000, True
+    base = HDC.rand_vec()
+    protos = noisy(np.repeat(base[None], 10, axis=0), 0.08)
+    mem = HDItemMem()
+    mem.add_many(list(range(10)), protos)
+    labels = HDC.rng.integers(10, size=200)
+    res = mem.wta_progressive(noisy(protos[labels], 0.25))
+    assert [key for key, _, _ in res] == labels.tolist()
+    assert np.mean([bits for _, _, bits in res]) < HDC.SIZE / 4
+
+
+def test_bit_flips_are_drawn_per_query(layout):
+    mem = HDItemMem()
+    mem.add_many(list(range(50)), HDC.rand_vec(50))
+    mem.prob_bit_flips = 0.1
+    queries = mem.vectors()[np.zeros(200, dtype=int)]
+    dists = mem.distance_matrix(queries)
+    # the query's own entry is about p away, and every query saw different noise
+    assert abs(dists[:, 0].mean() - 0.1) < 0.002
+    assert len(np.unique(dists[:, 0])) > 20
+    assert abs(dists[:, 1:].mean() - 0.5) < 0.002
+    res = mem.wta_progressive(queries[:20])
+    assert [key for key, _, _ in res] == [0] * 20
+    assert len({dist for _, dist, _ in res}) > 1
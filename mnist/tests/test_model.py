@@ -0,0 +1,119 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+import pytest
+from hdc.model import (save_model, load_model, read_header, unpack_rows, seeded_codebook, codebook_keys,
+                       ALIGN, HEADER)
+from hdc import HDC
+
+
+@pytest.fixture
+def tables():
+    rng = np.random.default_rng(1)
+    return rng.integers(2, size=(10, 1000)), rng.integers(2, size=(56, 1000))
+
+
+@pytest.mark.parametrize('word_bits', [8, 16, 32, 64])
+def test_round_trip(tmp_path, tables, word_bits):
+    item_memory, codebook = tables
+    path = str(tmp_path / 'm.hdcm')
+    save_model(path, item_memory, codebook, word_bits)
+    header, model_words, codebook_words = load_model(path)
+    assert (header['dims'], header['n_classes'], header['n_codebook']) == (1000, 10, 56)
+    assert header['word_bits'] == word_bits and header['seed'] is None
+    assert header['codebook_offset'] % ALIGN == 0 and header['model_offset'] % ALIGN == 0
+    np.testing.assert_array_equal(unpack_rows(model_words, header['dims']), item_memory)
+    np.testing.assert_array_equal(unpack_rows(codebook_words, header['dims']), codebook)
+
+
+def test_seeded_codebook_can_be_left_out(tmp_path, tables):
+    item_memory, _ = tables
+    codebook = HDC.keyed_vecs(codebook_keys(56), 5, 1000, packed=False)
+    full, seed_only = str(tmp_path / 'full.hdcm'), str(tmp_path / 'seed.hdcm')
+    save_model(full, item_memory, codebook, seed=5)
+    save_model(seed_only, item_memory, codebook, seed=5, store_codebook=False)
+    # files with the codebook stay readable by version 1 readers (main.c)
+    assert read_header(full)['version'] == 1 and read_header(seed_only)['version'] == 2
+    header, model_words, codebook_words = load_model(seed_only)
+    assert codebook_words is None and header['seed'] == 5
+    np.testing.assert_array_equal(seeded_codebook(header), codebook)
+    np.testing.assert_array_equal(unpack_rows(model_words, 1000), item_memory)
+
+
+def test_corruption_is_detected(tmp_path, tables):
+    path = tmp_path / 'm.hdcm'
+    save_model(str(path), *tables)
+    data = bytearray(path.read_bytes())
+    data[HEADER.size + 3] ^= 1
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="checksum"):
+        load_model(str(path))
+    load_model(str(path), verify=False)
+
+
+def test_foreign_and_newer_files_are_rejected(tmp_path, tables):
+    path = tmp_path / 'm.hdcm'
+    save_model(str(path), *tables)
+    data = path.read_bytes()
+    path.write_bytes(b'XXXX' + data[4:])
+    with pytest.raises(ValueError, match="not an HDC model"):
+        read_header(str(path))
+    path.write_bytes(data[:4] + (99).to_bytes(2, 'little') + data[6:])
+    with pytest.raises(ValueError, match="newer"):
+        read_header(str(path))
+
+
+MAIN_C = os.path.join(os.path.dirname(__file__), '..', '..', 'embedded-hdc', 'main.c')
+
+
+@pytest.fixture(scope='module')
+def c_loader(tmp_path_factory):
+    # embedded-hdc/main.c built as is; it loads the model named on its command line
+    compiler = shutil.which('cc') or shutil.which('gcc')
+    if compiler is None:
+        pytest.skip("no C compiler")
+    binary = str(tmp_path_factory.mktemp('c') / 'main')
+    subprocess.run([compiler, '-O2', '-o', binary, MAIN_C], check=True)
+    return lambda path: subprocess.run([binary, path], capture_output=True, text=True, cwd=os.path.dirname(binary))
+
+
+def corrupt_header(path, **fields):
+    # rewrite header fields in place, the checksum only covers the sections
+    data = path.read_bytes()
+    names = ('magic version header_size dims n_classes n_codebook word_bits flags '
+             'codebook_offset model_offset checksum seed').split()
+    header = dict(zip(names, HEADER.unpack(data[:HEADER.size])))
+    header.update(fields)
+    path.write_bytes(HEADER.pack(*(header[name] for name in names)) + data[HEADER.size:])
+
+
+@pytest.mark.parametrize('fields, error', [
+    (dict(header_size=0xffff), "header size"),
+    (dict(header_size=32), "header size"),
+    (dict(word_bits=12), "word size"),
+    (dict(word_bits=128), "word size"),
+    (dict(word_bits=0), "word size")])
+def test_bad_headers_are_rejected(tmp_path, c_loader, fields, error):
+    rng = np.random.default_rng(2)
+    path = tmp_path / 'm.hdcm'
+    save_model(str(path), rng.integers(2, size=(10, 1000)), rng.integers(2, size=(56, 1000)))
+    assert c_loader(str(path)).returncode == 0
+    corrupt_header(path, **fields)
+    with pytest.raises(ValueError, match=error):
+        load_model(str(path))
+    res = c_loader(str(path))
+    assert res.returncode != 0 and error in res.stderr
+
+
+def test_truncated_files_are_rejected(tmp_path, c_loader):
+    rng = np.random.default_rng(2)
+    path = tmp_path / 'm.hdcm'
+    save_model(str(path), rng.integers(2, size=(10, 1000)), rng.integers(2, size=(56, 1000)))
+    data = path.read_bytes()
+    for size in (40, HEADER.size, len(data) - 8):
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            load_model(str(path), verify=False)
+        res = c_loader(str(path))
+        assert res.returncode != 0 and "Truncated" in res.stderr
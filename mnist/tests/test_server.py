@@ -0,0 +1,107 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from hdc import HDC, HDDatabase, HDImageEncoder, HDItemMem
+from hdc.server import HDServer, HDClient, database_handlers, classifier_handlers, _run_batch, _Failed
+from test_database import ROWS
+
+
+@pytest.fixture
+def db():
+    HDC.SIZE, HDC.PACKED = 10000, True
+    db = HDDatabase()
+    db.bulk_load(ROWS)
+    return db
+
+
+def serve(handlers, path, session, **kwargs):
+    # runs session(client) against a server on a Unix socket and returns what it returns
+    async def run():
+        server = await HDServer(handlers, **kwargs).start(str(path))
+        client = await HDClient.connect(str(path))
+        try:
+            return await session(client)
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(run())
+
+
+def test_concurrent_calls_match_direct_queries(db, tmp_path):
+    pairs = [(key, field) for key, fields in ROWS for field in fields] * 5
+
+    async def session(client):
+        return await asyncio.gather(*(client.call('get_value', key=key, field=field) for key, field in pairs))
+
+    assert serve(database_handlers(db), tmp_path / 's', session) == [db.get_value(k, f) for k, f in pairs]
+
+
+def test_other_database_operations(db, tmp_path):
+    query = dict(Type='Vaccine', Attribute='Fire')
+
+    async def session(client):
+        return await asyncio.gather(client.call('get_matches', fields=query, threshold=0.3),
+                                    client.call('get_matches', fields=dict(Stage='Rookie')),
+                                    client.call('get_analogy', target_key='Agumon', other_key='Tentomon',
+                                                target_value='Fire'))
+
+    matches, rookies, analogy = serve(database_handlers(db), tmp_path / 's', session)
+    assert matches == db.get_matches(query, threshold=0.3)
+    assert rookies == db.get_matches(dict(Stage='Rookie'))
+    assert analogy['value'] == 'Plant'
+
+
+def test_errors_fail_only_their_request(db, tmp_path):
+    async def session(client):
+        return await asyncio.gather(client.call('get_value', key='Agumon', field='Stage'),
+                                    client.call('get_value', key='Agumon'),
+                                    client.call('no_such_op'),
+                                    return_exceptions=True)
+
+    good, missing, unknown = serve(database_handlers(db), tmp_path / 's', session)
+    assert good == 'Rookie'
+    assert isinstance(missing, RuntimeError) and 'KeyError' in str(missing)
+    assert isinstance(unknown, RuntimeError) and 'unknown op' in str(unknown)
+
+
+def test_run_batch_retries_one_request_at_a_time():
+    def fxn(requests):
+        if any(r < 0 for r in requests):
+            raise ValueError("negative")
+        return [r * 2 for r in requests]
+
+    assert _run_batch(fxn, [1, 2]) == [2, 4]
+    res = _run_batch(fxn, [1, -1, 3])
+    assert res[0] == 2 and res[2] == 6 and isinstance(res[1], _Failed)
+    with pytest.raises(ValueError):
+        _run_batch(fxn, [-1])
+
+
+def test_slow_batches_time_out(tmp_path):
+    def slow(requests):
+        time.sleep(0.2)
+        return requests
+
+    async def session(client):
+        return await asyncio.gather(client.call('slow'), return_exceptions=True)
+
+    (res,) = serve(dict(slow=slow), tmp_path / 's', session, timeout=0.05)
+    assert isinstance(res, RuntimeError) and str(res) == 'timeout'
+
+
+def test_classify(tmp_path):
+    HDC.SIZE, HDC.PACKED = 2048, True
+    positions = HDC.rand_vec(56)
+    encoder = HDImageEncoder(positions[:28], positions[28:])
+    images = np.where(HDC.rng.random((3, 28, 28)) < 0.3, 255, 0).astype(np.uint8)
+    classes = HDItemMem()
+    classes.add_many([7, 8, 9], encoder.encode_batch(images))
+
+    async def session(client):
+        return await asyncio.gather(*(client.call('classify', image=image) for image in images[::-1]))
+
+    res = serve(classifier_handlers(encoder, classes), tmp_path / 's', session)
+    assert [r['label'] for r in res] == [9, 8, 7]
+    assert [r['dist'] for r in res] == [0, 0, 0]
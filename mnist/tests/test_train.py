@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from conftest import load_script
+from hdc import HDC
+from hdc.data import MNISTData
+
+hdc_ml = load_script('hdc-ml')
+
+
+def synthetic(n, seed=0):
+    # 10 random class patterns, every image one of them with 5% of its pixels flipped
+    rng = np.random.default_rng(seed)
+    patterns = rng.random((10, 28, 28)) < 0.3
+    labels = rng.integers(10, size=n)
+    images = patterns[labels] ^ (rng.random((n, 28, 28)) < 0.05)
+    return MNISTData(np.where(images, 255, 0).astype(np.uint8), labels, source='synthetic:%d' % seed)
+
+
+def close_classes(n, seed=0):
+    # classes 3% apart under 30% pixel noise, which one bundling pass gets wrong often enough
+    rng = np.random.default_rng(seed)
+    patterns = (rng.random((28, 28)) < 0.3) ^ (rng.random((10, 28, 28)) < 0.03)
+    labels = rng.integers(10, size=n)
+    images = patterns[labels] ^ (rng.random((n, 28, 28)) < 0.3)
+    return MNISTData(np.where(images, 255, 0).astype(np.uint8), labels)
+
+
+@pytest.fixture
+def classifier():
+    HDC.SIZE, HDC.PACKED = 2048, True
+    return hdc_ml.MNISTClassifier(seed=3)
+
+
+def prototypes(classifier):
+    return dict(zip(classifier.classifier.all_keys(), map(tuple, classifier.classifier.vectors())))
+
+
+def test_train_parallel_matches_train(classifier):
+    data = synthetic(700)
+    classifier.train(data)
+    expected = prototypes(classifier)
+    assert sorted(expected) == list(range(10))
+    classifier.train_parallel(data, processes=2)
+    assert prototypes(classifier) == expected
+
+
+def test_partial_fit_matches_train(classifier):
+    data = synthetic(700)
+    classifier.train(data)
+    expected = prototypes(classifier)
+    classifier.classifier = hdc_ml.HDItemMem()
+    for images, labels, _ in data.batches(300):
+        classifier.partial_fit(images, labels)
+    assert prototypes(classifier) == expected
+
+
+def accuracy(classifier, data):
+    hvs, labels = classifier.encode_dataset(data)
+    return np.mean(classifier.predict_encoded(hvs)[0] == labels)
+
+
+def test_retrain_improves_on_bundling(classifier):
+    data = close_classes(600)
+    history = classifier.retrain(data, epochs=5, validation=0)
+    assert max(history) > history[0]
+    assert accuracy(classifier, data) == max(history)
+
+
+def test_retrain_keeps_the_best_prototypes(classifier):
+    # the one epoch scores below the bundling pass, so its prototypes are dropped
+    data = close_classes(600)
+    history = classifier.retrain(data, epochs=1, validation=0)
+    assert history[1] < history[0]
+    assert accuracy(classifier, data) == history[0]
+
+
+def test_cached_parallel_training_matches(classifier, tmp_path):
+    data = synthetic(700)
+    classifier.train(data)
+    expected = prototypes(classifier)
+    classifier.use_cache(str(tmp_path), source=data.identity)
+    for _ in range(2):
+        # the first pass fills the cache from the workers, the second reads it
+        classifier.train_parallel(data, processes=2)
+        assert prototypes(classifier) == expected
+    assert classifier.cache.lookup(data.indices)[0].all()
+
+
+def test_evaluate_parallel_matches_count_correct(classifier):
+    train, test = synthetic(500, seed=1), synthetic(300, seed=1).subset(np.arange(200, 300))
+    classifier.train(train)
+    correct, count = classifier.count_correct(*next(test.batches(1000)))
+    assert count == 100 and correct >= 90
+    assert classifier.evaluate_parallel(test, processes=2) == correct / count